@@ -0,0 +1,603 @@
+import json
+import math
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import OrderedDict, deque
+
+"""
+Local stand-ins for the services the handlers and the scraper talk to:
+SQS, DynamoDB, SES, Lex, OpenSearch and the Yelp search API.
+
+install() registers module facades for boto3, botocore.exceptions,
+opensearchpy and requests, so the real LF0/LF1/LF2 and yelp_scraper code runs
+unchanged against in-memory backends, never against AWS. Every call sleeps for
+the injected latency of its service, e.g. {'sqs': 5, 'dynamodb': 2} in ms.
+"""
+
+SERVICES = ('sqs', 'dynamodb', 'ses', 'lex', 'opensearch', 'yelp')
+
+
+class Latency(object):
+    """
+    injected latency per service, in milliseconds, with optional relative jitter
+    """
+
+    def __init__(self, latency_ms=None, jitter=0.0, seed=None):
+        self.latency_ms = dict.fromkeys(SERVICES, 0.0)
+        self.latency_ms.update(latency_ms or {})
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def wait(self, service):
+        ms = self.latency_ms.get(service, 0.0)
+        if ms <= 0:
+            return
+        if self.jitter:
+            ms *= 1 + self.jitter * (2 * self.random.random() - 1)
+        time.sleep(ms / 1000.0)
+
+
+class ClientError(Exception):
+    """
+    same shape as botocore.exceptions.ClientError
+    """
+
+    def __init__(self, error_response, operation_name):
+        self.response = error_response
+        self.operation_name = operation_name
+        super(ClientError, self).__init__(error_response['Error']['Message'])
+
+
+class RequestError(Exception):
+    """
+    same shape as opensearchpy.RequestError, a 400 from OpenSearch
+    """
+
+    def __init__(self, status_code, error, info=None):
+        self.status_code = status_code
+        self.error = error
+        self.info = info
+        super(RequestError, self).__init__(status_code, error, info)
+
+
+""" --- SQS --- """
+
+
+class LocalQueue(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.visible = deque()
+        # receipt handle -> (visibility deadline, message), the deadline is None
+        # for messages received with VisibilityTimeout=0, which stay visible
+        self.handles = {}
+        self.hidden = 0
+        self.sent = 0
+        self.deleted = 0
+        # send API calls and payload bytes (body plus attribute names and values)
+        self.send_requests = 0
+        self.bytes_sent = 0
+
+    def depth(self):
+        with self.lock:
+            self.release_expired()
+            return len(self.visible) + self.hidden
+
+    def release_expired(self):
+        if not self.hidden:
+            return
+        now = time.time()
+        for handle, (deadline, message) in list(self.handles.items()):
+            if deadline is not None and deadline <= now:
+                del self.handles[handle]
+                self.hidden -= 1
+                self.visible.append(message)
+
+
+class LocalSQS(object):
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def queue(self, queue_url):
+        with self.lock:
+            if queue_url not in self.queues:
+                self.queues[queue_url] = LocalQueue()
+            return self.queues[queue_url]
+
+    def enqueue(self, queue, MessageBody, MessageAttributes=None):
+        message = {'MessageId': str(uuid.uuid4()), 'Body': MessageBody}
+        size = len(MessageBody.encode('utf-8'))
+        if MessageAttributes:
+            message['MessageAttributes'] = MessageAttributes
+            for name, value in MessageAttributes.items():
+                size += len(name) + len(value['DataType']) + len(value.get('StringValue') or '')
+        with queue.lock:
+            queue.visible.append(message)
+            queue.sent += 1
+            queue.bytes_sent += size
+        return message['MessageId']
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None, **kwargs):
+        self.backend.latency.wait('sqs')
+        queue = self.queue(QueueUrl)
+        with queue.lock:
+            queue.send_requests += 1
+        return {'MessageId': self.enqueue(queue, MessageBody, MessageAttributes)}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        self.backend.latency.wait('sqs')
+        if not 1 <= len(Entries) <= 10:
+            raise ClientError({'Error': {'Code': 'TooManyEntriesInBatchRequest',
+                                         'Message': 'batch of {} entries'.format(len(Entries))}},
+                              'SendMessageBatch')
+        queue = self.queue(QueueUrl)
+        with queue.lock:
+            queue.send_requests += 1
+        successful = [{'Id': entry['Id'],
+                       'MessageId': self.enqueue(queue, entry['MessageBody'], entry.get('MessageAttributes'))}
+                      for entry in Entries]
+        return {'Successful': successful, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, VisibilityTimeout=30, **kwargs):
+        self.backend.latency.wait('sqs')
+        queue = self.queue(QueueUrl)
+        messages = []
+        with queue.lock:
+            queue.release_expired()
+            count = min(MaxNumberOfMessages, len(queue.visible))
+            for _ in range(count):
+                if VisibilityTimeout > 0:
+                    message = queue.visible.popleft()
+                    deadline = time.time() + VisibilityTimeout
+                    queue.hidden += 1
+                else:
+                    message = queue.visible[len(messages)]
+                    deadline = None
+                handle = str(uuid.uuid4())
+                queue.handles[handle] = (deadline, message)
+                messages.append(dict(message, ReceiptHandle=handle))
+        if not messages:
+            return {}
+        return {'Messages': messages}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.backend.latency.wait('sqs')
+        queue = self.queue(QueueUrl)
+        with queue.lock:
+            entry = queue.handles.pop(ReceiptHandle, None)
+            if entry is None:
+                return {}
+            deadline, message = entry
+            if deadline is None:
+                try:
+                    queue.visible.remove(message)
+                except ValueError:
+                    return {}
+            else:
+                queue.hidden -= 1
+            queue.deleted += 1
+        return {}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self.backend.latency.wait('sqs')
+        queue = self.queue(QueueUrl)
+        with queue.lock:
+            entry = queue.handles.get(ReceiptHandle)
+            if entry is None:
+                return {}
+            deadline, message = entry
+            if deadline is None:
+                try:
+                    queue.visible.remove(message)
+                except ValueError:
+                    return {}
+                queue.hidden += 1
+            queue.handles[ReceiptHandle] = (time.time() + VisibilityTimeout, message)
+            queue.release_expired()
+        return {}
+
+
+""" --- DynamoDB --- """
+
+
+class LocalTable(object):
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def put_item(self, Item, **kwargs):
+        self.backend.latency.wait('dynamodb')
+        key = next(iter(Item.items()))
+        with self.lock:
+            self.items[key] = dict(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self.backend.latency.wait('dynamodb')
+        item = self.items.get(next(iter(Key.items())))
+        if item is None:
+            return {}
+        return {'Item': dict(item)}
+
+
+class LocalDynamoDB(object):
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def Table(self, name):
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = LocalTable(self.backend, name)
+            return self.tables[name]
+
+
+""" --- SES and Lex --- """
+
+
+class LocalSES(object):
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_email(self, Destination, Message, Source, **kwargs):
+        self.backend.latency.wait('ses')
+        message_id = str(uuid.uuid4())
+        with self.lock:
+            self.sent.append({'MessageId': message_id, 'To': Destination['ToAddresses'],
+                              'Body': Message['Body']['Text']['Data']})
+        return {'MessageId': message_id}
+
+
+class LocalLex(object):
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def post_text(self, botName, botAlias, userId, inputText, **kwargs):
+        self.backend.latency.wait('lex')
+        return {'message': 'Hi, what can I assist you today?', 'dialogState': 'Fulfilled'}
+
+
+""" --- OpenSearch --- """
+
+
+class LocalIndices(object):
+
+    def __init__(self, opensearch):
+        self.opensearch = opensearch
+
+    def exists(self, index, **kwargs):
+        return index in self.opensearch.data
+
+    def create(self, index, body=None, **kwargs):
+        self.opensearch.index_data(index)
+        self.opensearch.mappings[index] = dict((body or {}).get('mappings', {}).get('properties', {}))
+        return {'acknowledged': True}
+
+    def put_mapping(self, index, body, **kwargs):
+        self.opensearch.mappings.setdefault(index, {}).update(body.get('properties', {}))
+        return {'acknowledged': True}
+
+    def get_mapping(self, index, **kwargs):
+        return {index: {'mappings': {'properties': dict(self.opensearch.mappings.get(index, {}))}}}
+
+
+class LocalOpenSearch(object):
+    """
+    In-memory index for the queries the handlers send: match, multi_match and
+    term clauses, bool must/filter, and a _geo_distance sort on a geo_point.
+    Postings are kept per (field, term) and per term over all fields.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.data = {}
+        self.mappings = {}
+        self.indices = LocalIndices(self)
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        # stands in for the opensearchpy.OpenSearch constructor
+        return self
+
+    def index_data(self, index):
+        """
+        (docs, postings) of an index, created on first use
+        """
+        with self.lock:
+            if index not in self.data:
+                self.data[index] = (OrderedDict(), {})
+            return self.data[index]
+
+    def index(self, index, body, id=None, **kwargs):
+        self.backend.latency.wait('opensearch')
+        if isinstance(body, str):
+            body = json.loads(body)
+        docs, postings = self.index_data(index)
+        with self.lock:
+            docs[id] = body
+            for field, term in terms(body):
+                postings.setdefault((field, term), OrderedDict())[id] = None
+                postings.setdefault((None, term), OrderedDict())[id] = None
+        return {'_id': id, 'result': 'created'}
+
+    def search(self, body, index, **kwargs):
+        self.backend.latency.wait('opensearch')
+        docs, postings = self.index_data(index)
+        ids = self.matching(body.get('query', {'match_all': {}}), docs, postings)
+
+        sort_key = None
+        for clause in body.get('sort', ()):
+            if '_geo_distance' in clause:
+                sort = clause['_geo_distance']
+                field = geo_field(sort)
+                mapped = self.mappings.get(index, {}).get(field, {}).get('type') == 'geo_point'
+                if not mapped and not sort.get('ignore_unmapped'):
+                    raise RequestError(400, 'search_phase_execution_exception',
+                                       'failed to find mapper for [{}] for geo distance based sort'.format(field))
+                sort_key = geo_distance_key(sort)
+
+        hits = []
+        for doc_id in ids:
+            hit = {'_id': doc_id, '_index': index, '_source': docs[doc_id]}
+            if sort_key is not None:
+                # like OpenSearch, documents without a point sort last
+                distance = sort_key(docs[doc_id])
+                hit['sort'] = [float('inf') if distance is None else distance]
+            hits.append(hit)
+        if sort_key is not None:
+            hits.sort(key=lambda hit: hit['sort'][0])
+
+        total = len(hits)
+        hits = hits[:body.get('size', 10)]
+        return {'hits': {'total': {'value': total}, 'hits': hits}}
+
+    def matching(self, query, docs, postings):
+        """
+        ids of the documents matching a query, in index order
+        """
+        if 'match_all' in query:
+            return list(docs)
+        if 'multi_match' in query:
+            return list(postings.get((None, str(query['multi_match']['query']).lower()), ()))
+        if 'match' in query or 'term' in query:
+            field, value = next(iter((query.get('match') or query.get('term')).items()))
+            if isinstance(value, dict):
+                value = value.get('query', value.get('value'))
+            return list(postings.get((field, str(value).lower()), ()))
+        if 'bool' in query:
+            clauses = []
+            for key in ('must', 'filter'):
+                clause = query['bool'].get(key, [])
+                clauses += clause if isinstance(clause, list) else [clause]
+            if not clauses:
+                return list(docs)
+            sets = [self.matching(clause, docs, postings) for clause in clauses]
+            rest = [set(ids) for ids in sets[1:]]
+            return [doc_id for doc_id in sets[0] if all(doc_id in ids for ids in rest)]
+        raise ValueError('query not supported by the local OpenSearch: {}'.format(query))
+
+    def get(self, index, id, **kwargs):
+        self.backend.latency.wait('opensearch')
+        docs, _ = self.index_data(index)
+        return {'_id': id, '_index': index, '_source': docs[id]}
+
+
+def geo_field(sort):
+    """
+    name of the geo_point field of a _geo_distance sort
+    """
+    return next(k for k in sort if k not in ('order', 'unit', 'distance_type', 'ignore_unmapped'))
+
+
+def geo_distance_key(sort):
+    """
+    document -> km from the sort origin, None when the document has no point
+    """
+    field = geo_field(sort)
+    origin = sort[field]
+
+    def key(doc):
+        point = doc.get(field)
+        if not point:
+            return None
+        return haversine_km(origin['lat'], origin['lon'], point['lat'], point['lon'])
+    return key
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def terms(value, field=None):
+    """
+    (top level field, lower-cased string value) pairs of a document, lists included
+    """
+    if isinstance(value, str):
+        yield field, value.lower()
+    elif isinstance(value, dict):
+        for key, v in value.items():
+            for pair in terms(v, key if field is None else field):
+                yield pair
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            for pair in terms(v, field):
+                yield pair
+
+
+""" --- Yelp --- """
+
+
+class LocalYelp(object):
+    """
+    serves /v3/businesses/search from a generated catalog
+    """
+
+    def __init__(self, backend, per_query=200, seed=0):
+        self.backend = backend
+        self.per_query = per_query
+        self.seed = seed
+
+    def search(self, term, location, offset, limit):
+        cuisine = term.replace('+', ' ').split(' ')[0]
+        location = location.replace('+', ' ')
+        rng = random.Random('{}|{}|{}'.format(self.seed, cuisine, location))
+        total = rng.randint(self.per_query // 2, self.per_query)
+        businesses = [make_business(rng, cuisine, location, '{}-{}-{}'.format(cuisine, location, i))
+                      for i in range(offset, min(offset + limit, total))]
+        return {'businesses': businesses, 'total': total}
+
+
+class LocalResponse(object):
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def json(self):
+        return self.payload
+
+
+def make_business(rng, cuisine, location, business_id):
+    """
+    one business in the shape of a Yelp search result
+    """
+    city = location.split(',')[0]
+    return {
+        'id': business_id,
+        'name': '{} {} #{}'.format(cuisine.title(), city, business_id.rsplit('-', 1)[-1]),
+        'location': {
+            'display_address': ['{} Broadway'.format(rng.randint(1, 999)),
+                                'New York, NY 100{:02d}'.format(rng.randint(1, 99))
+                                if rng.random() > 0.05 else 'Hoboken, NJ 07030'],
+            'zip_code': '100{:02d}'.format(rng.randint(1, 99)),
+        },
+        'coordinates': {'latitude': 40.70 + rng.random() * 0.12,
+                        'longitude': -74.02 + rng.random() * 0.08},
+        'review_count': rng.randint(1, 3000),
+        'rating': rng.choice([2.5, 3.0, 3.5, 4.0, 4.5, 5.0]),
+    }
+
+
+def make_catalog(size, cuisines, seed=0):
+    """
+    yelp_scrape style catalog of `size` restaurants: business id -> business
+    """
+    rng = random.Random(seed)
+    restaurants = {}
+    for i in range(size):
+        cuisine = cuisines[i % len(cuisines)]
+        business = make_business(rng, cuisine, 'Manhattan, NY', 'biz-{}'.format(i))
+        business['cuisine'] = [cuisine]
+        if rng.random() < 0.1:
+            other = rng.choice(cuisines)
+            if other != cuisine:
+                business['cuisine'].append(other)
+        restaurants[business['id']] = business
+    return restaurants
+
+
+""" --- Facades --- """
+
+
+class LocalBackend(object):
+    """
+    all stand-ins behind one object, shared by the facades
+    """
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.sqs = LocalSQS(self)
+        self.dynamodb = LocalDynamoDB(self)
+        self.ses = LocalSES(self)
+        self.lex = LocalLex(self)
+        self.opensearch = LocalOpenSearch(self)
+        self.yelp = LocalYelp(self)
+
+    def reset(self):
+        """
+        drop all stored data in place, so clients cached by the handlers stay valid
+        """
+        for queue in self.sqs.queues.values():
+            with queue.lock:
+                queue.visible.clear()
+                queue.handles.clear()
+                queue.hidden = queue.sent = queue.deleted = 0
+                queue.send_requests = queue.bytes_sent = 0
+        for table in self.dynamodb.tables.values():
+            table.items.clear()
+        for docs, postings in self.opensearch.data.values():
+            docs.clear()
+            postings.clear()
+        self.opensearch.mappings.clear()
+        del self.ses.sent[:]
+
+    def client(self, service, *args, **kwargs):
+        clients = {'sqs': self.sqs, 'ses': self.ses, 'lex-runtime': self.lex}
+        return clients[service]
+
+    def resource(self, service, *args, **kwargs):
+        if service != 'dynamodb':
+            raise ValueError('no local resource for ' + service)
+        return self.dynamodb
+
+    def request(self, method, url, headers=None, params=None, **kwargs):
+        self.latency.wait('yelp')
+        params = params or {}
+        location = params.get('location')
+        if location is None:
+            location = '{:.3f}+{:.3f}'.format(float(params['latitude']), float(params['longitude']))
+        return LocalResponse(self.yelp.search(params.get('term', ''), location,
+                                              int(params.get('offset', 0)), int(params.get('limit', 50))))
+
+
+def install(backend):
+    """
+    register the facades in sys.modules, call before importing handlers or the scraper
+    """
+    boto3 = types.ModuleType('boto3')
+    boto3.client = backend.client
+    boto3.resource = backend.resource
+
+    botocore = types.ModuleType('botocore')
+    exceptions = types.ModuleType('botocore.exceptions')
+    exceptions.ClientError = ClientError
+    botocore.exceptions = exceptions
+
+    opensearchpy = types.ModuleType('opensearchpy')
+    opensearchpy.OpenSearch = backend.opensearch
+    opensearchpy.RequestsHttpConnection = object
+    opensearchpy.RequestError = RequestError
+
+    requests = types.ModuleType('requests')
+    requests.request = backend.request
+
+    requests_aws4auth = types.ModuleType('requests_aws4auth')
+    requests_aws4auth.AWS4Auth = object
+
+    sys.modules.update({
+        'boto3': boto3,
+        'botocore': botocore,
+        'botocore.exceptions': exceptions,
+        'opensearchpy': opensearchpy,
+        'requests': requests,
+        'requests_aws4auth': requests_aws4auth,
+    })
+    return backend
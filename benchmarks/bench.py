@@ -0,0 +1,307 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+
+import backends
+
+"""
+Offline end-to-end benchmark of the handlers and the ingest scripts.
+
+The real LF0, LF1, LF2 and yelp_scraper code runs against the local stand-ins
+in backends.py, with optional injected latency per service. Results are written
+as JSON so runs can be compared over time.
+
+Usage (from the repository root):
+
+    python benchmarks/bench.py --sizes 100,1000,5000 --requests 200 \
+        --latency sqs=5,dynamodb=3,opensearch=10 --output bench_results.json
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT, 'lambda_functions')
+
+
+def load_handlers(backend):
+    """
+    install the stand-ins and import the handlers and the scraper against them
+    """
+    backends.install(backend)
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    for path in (ROOT, LAMBDA_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    with quiet():
+        import LF0
+        import LF1
+        import LF2
+        import yelp_scraper
+    return LF0, LF1, LF2, yelp_scraper
+
+
+@contextmanager
+def quiet():
+    """
+    silence the prints of the handlers while they are timed
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        yield
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples, wall_seconds):
+    """
+    latency percentiles in ms and throughput per second for a list of seconds
+    """
+    ordered = sorted(samples)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        'count': len(ordered),
+        'throughput_per_s': round(len(ordered) / wall_seconds, 2) if wall_seconds > 0 else None,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p90_ms': ms(percentile(ordered, 0.90)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else None,
+    }
+
+
+def timed_calls(fn, calls):
+    """
+    call fn(*args) for every args tuple, return (per-call seconds, wall seconds)
+    """
+    samples = []
+    start = time.perf_counter()
+    with quiet():
+        for args in calls:
+            t = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - t)
+    return samples, time.perf_counter() - start
+
+
+@contextmanager
+def recording(obj, name, samples):
+    """
+    time every call of obj.name into samples while the block runs
+    """
+    original = getattr(obj, name)
+
+    def wrapper(*args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - t)
+
+    setattr(obj, name, wrapper)
+    try:
+        yield
+    finally:
+        delattr(obj, name)
+
+
+""" --- Lex events --- """
+
+
+def lex_event(intent_name, slots=None, source='DialogCodeHook'):
+    """
+    event in the shape LF1.lambda_handler receives from Lex
+    """
+    return {
+        'bot': {'name': 'DiningConcierge', 'alias': 'dine', 'version': '$LATEST'},
+        'userId': 'testuser',
+        'inputTranscript': '',
+        'invocationSource': source,
+        'outputDialogMode': 'Text',
+        'messageVersion': '1.0',
+        'sessionAttributes': {},
+        'currentIntent': {
+            'name': intent_name,
+            'slots': dict(slots or {}),
+            'confirmationStatus': 'None',
+        },
+    }
+
+
+def dining_slots(cuisine, date=None, email='user@example.com', **overrides):
+    date = date or (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    slots = {
+        'Location': 'Manhattan',
+        'Cuisine': cuisine,
+        'NumberOfPeople': '2',
+        'Date': date,
+        'Time': '19:00',
+        'Email': email,
+    }
+    slots.update(overrides)
+    return slots
+
+
+""" --- Benchmarks --- """
+
+
+def bench_ingest(scraper, backend, size, cuisines):
+    """
+    DynamoDB_store and OpenSearch_store over a generated catalog of `size` restaurants
+    """
+    restaurants = backends.make_catalog(size, cuisines)
+    fd, file_path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as json_file:
+        json.dump(restaurants, json_file)
+
+    results = []
+    try:
+        table = backend.dynamodb.Table('yelp-restaurants')
+        for name, obj, method, store in (
+                ('DynamoDB_store', table, 'put_item', scraper.DynamoDB_store),
+                ('OpenSearch_store', backend.opensearch, 'index', scraper.OpenSearch_store)):
+            samples = []
+            with recording(obj, method, samples):
+                _, wall = timed_calls(store, [(file_path,)])
+            results.append(dict(name=name, catalog_size=size, **summarize(samples, wall)))
+    finally:
+        os.remove(file_path)
+    return results
+
+
+def bench_lf1(LF1, requests, cuisines):
+    """
+    LF1 dialog turns: greeting, validation (valid and invalid slots), fulfillment
+    """
+    turns = {
+        'greeting': [lex_event('GreetingIntent')],
+        'validate_valid': [lex_event('DiningSuggestionsIntent', dining_slots(c)) for c in cuisines],
+        'validate_invalid': [lex_event('DiningSuggestionsIntent', dining_slots('Greek')),
+                             lex_event('DiningSuggestionsIntent', dining_slots('Itallian', Time='05:00'))],
+        'fulfillment': [lex_event('DiningSuggestionsIntent', dining_slots(c), source='FulfillmentCodeHook')
+                        for c in cuisines],
+    }
+    results = []
+    for turn, events in turns.items():
+        calls = [(events[i % len(events)], None) for i in range(requests)]
+        samples, wall = timed_calls(LF1.lambda_handler, calls)
+        results.append(dict(name='LF1.' + turn, **summarize(samples, wall)))
+    return results
+
+
+def bench_lf2(LF1, LF2, backend, size, requests, cuisines):
+    """
+    LF2.lambda_handler draining `requests` messages enqueued by LF1
+    """
+    # candidates cached by LF2 belong to the previous catalog size
+    LF2._candidates.clear()
+    LF2._index_fields.clear()
+    fulfill = [(lex_event('DiningSuggestionsIntent', dining_slots(cuisines[i % len(cuisines)]),
+                          source='FulfillmentCodeHook'), None) for i in range(requests)]
+    timed_calls(LF1.lambda_handler, fulfill)
+
+    samples, wall = timed_calls(LF2.lambda_handler, [({}, None)] * requests)
+    return [dict(name='LF2.lambda_handler', catalog_size=size, emails_sent=len(backend.ses.sent),
+                 **summarize(samples, wall))]
+
+
+def bench_enqueue(LF1, backend, requests, cuisines):
+    """
+    LF1.SQS_send one by one against LF1.SQS_send_batch, per request enqueued
+    """
+    queue = backend.sqs.queue(LF1.QUEUE_URL)
+    data = [dining_slots(cuisines[i % len(cuisines)]) for i in range(requests)]
+    results = []
+    for name, fn, calls in (('LF1.SQS_send', LF1.SQS_send, [(d,) for d in data]),
+                            ('LF1.SQS_send_batch', LF1.SQS_send_batch, [(data,)])):
+        backend.reset()
+        samples, wall = timed_calls(fn, calls)
+        if len(samples) < requests:
+            # one call for many requests, report the cost per request
+            samples = [wall / requests] * requests
+        results.append(dict(name=name, sqs_requests=queue.send_requests,
+                            bytes_per_message=round(queue.bytes_sent / float(queue.sent), 1),
+                            **summarize(samples, wall)))
+    backend.reset()
+    return results
+
+
+def bench_lf0(LF0, requests):
+    event = {'messages': [{'type': 'unstructured', 'unstructured': {'text': 'hello'}}]}
+    samples, wall = timed_calls(LF0.lambda_handler, [(event, None)] * requests)
+    return [dict(name='LF0.lambda_handler', **summarize(samples, wall))]
+
+
+def parse_latency(text):
+    """
+    'sqs=5,dynamodb=2' -> {'sqs': 5.0, 'dynamodb': 2.0}
+    """
+    latency = {}
+    for part in filter(None, text.split(',')):
+        service, ms = part.split('=')
+        if service not in backends.SERVICES:
+            raise ValueError('unknown service {}, expected one of {}'.format(service, backends.SERVICES))
+        latency[service] = float(ms)
+    return latency
+
+
+def run(sizes, requests, latency, jitter=0.0):
+    backend = backends.LocalBackend(backends.Latency(latency, jitter=jitter, seed=0))
+    LF0, LF1, LF2, scraper = load_handlers(backend)
+    cuisines = list(scraper.catalog.CUISINE_NAMES)
+
+    results = bench_lf0(LF0, requests) + bench_lf1(LF1, requests, cuisines)
+    results += bench_enqueue(LF1, backend, requests, cuisines)
+    for size in sizes:
+        backend.reset()
+        results += bench_ingest(scraper, backend, size, cuisines)
+        results += bench_lf2(LF1, LF2, backend, size, requests, cuisines)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'requests': requests,
+        'latency_ms': backend.latency.latency_ms,
+        'jitter': jitter,
+        'results': results,
+    }
+
+
+def print_table(report):
+    print('{:<28} {:>7} {:>8} {:>10} {:>9} {:>9} {:>9}'.format(
+        'benchmark', 'size', 'count', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for r in report['results']:
+        print('{:<28} {:>7} {:>8} {:>10} {:>9} {:>9} {:>9}'.format(
+            r['name'], r.get('catalog_size', '-'), r['count'], r['throughput_per_s'],
+            r['p50_ms'], r['p90_ms'], r['p99_ms']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of the handlers and the ingest scripts.')
+    parser.add_argument('--sizes', default='100,1000,5000',
+                        help='comma separated catalog sizes for ingest and LF2')
+    parser.add_argument('--requests', type=int, default=200, help='invocations per handler benchmark')
+    parser.add_argument('--latency', default='', help='injected latency per service in ms, e.g. sqs=5,ses=20')
+    parser.add_argument('--jitter', type=float, default=0.0, help='relative latency jitter, e.g. 0.2')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    report = run(sizes, args.requests, parse_latency(args.latency), args.jitter)
+
+    with open(args.output, 'w') as json_file:
+        json.dump(report, json_file, indent=4)
+    print_table(report)
+    print('\nResults written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import bench
+
+"""
+Synthetic load through LF1 into the local queue, drained by LF2 consumers.
+
+Multi-turn DiningSuggestionsIntent sessions are replayed in the shape Lex
+sends to LF1: one DialogCodeHook turn per slot as it gets filled, some slots
+first filled with an invalid value and then corrected, and a final
+FulfillmentCodeHook turn that goes through LF1.SQS_send. Like Lex, each turn
+carries the slots LF1 returned on the previous turn. Sessions start at a
+target rate (paced) or in open-loop bursts, while a pool of LF2 consumers
+drains the queue. The report has the enqueue rate, the queue depth over time,
+its growth rate and the drain rate of the consumers.
+
+Usage (from the repository root):
+
+    python benchmarks/loadgen.py --rate 50 --duration 10 --consumers 4 \
+        --latency sqs=5,dynamodb=3,opensearch=10,ses=20 --output loadgen_results.json
+"""
+
+SLOT_ORDER = ('Location', 'Cuisine', 'NumberOfPeople', 'Date', 'Time', 'Email')
+
+INVALID_VALUES = {
+    'Location': ['Boston', 'Chicago', 'San Francisco'],
+    'Cuisine': ['Greek', 'French', 'Ethiopian'],
+    'NumberOfPeople': ['0', 'two', '-3'],
+    'Date': ['2020-01-01', 'tomorrow-ish', '2021-13-40'],
+    'Time': ['05:00', '3am', '02:30'],
+}
+
+
+def cuisine_variants(catalog):
+    """
+    ways users type each cuisine: canonical, title case, aliases, '<x> food' and a typo
+    """
+    variants = {}
+    aliases = catalog.aliases('cuisines')
+    for alias, name in aliases.items():
+        variants.setdefault(name, []).append(alias)
+    for name in catalog.CUISINE_NAMES:
+        typo = name[:2] + name[2] * 2 + name[3:] if len(name) > 3 else name
+        variants[name] += [name.title(), name + ' food', name.title() + ' cuisine', typo]
+    return variants
+
+
+def make_session(rng, variants, invalid_ratio, session_id):
+    """
+    (slot, value) fills of one dialog, in the order the user answers
+    """
+    today = datetime.date.today()
+    cuisine = rng.choice(sorted(variants))
+    final = {
+        'Location': rng.choice(['Manhattan', 'manhattan', 'NYC', 'New York']),
+        'Cuisine': rng.choice(variants[cuisine]),
+        'NumberOfPeople': str(rng.randint(1, 12)),
+        'Date': (today + datetime.timedelta(days=rng.randint(0, 30))).isoformat(),
+        'Time': '{:02d}:{:02d}'.format(rng.randint(7, 23), rng.choice([0, 15, 30, 45])),
+        'Email': 'user{}@example.com'.format(session_id),
+    }
+
+    fills = []
+    for slot in SLOT_ORDER:
+        if slot in INVALID_VALUES and rng.random() < invalid_ratio:
+            fills.append((slot, rng.choice(INVALID_VALUES[slot])))
+        fills.append((slot, final[slot]))
+    return fills
+
+
+def session_events(LF1, fills):
+    """
+    replay the fills through LF1 one turn at a time, yielding (event, response)
+    """
+    slots = dict.fromkeys(SLOT_ORDER)
+    for slot, value in fills:
+        slots[slot] = value
+        event = bench.lex_event('DiningSuggestionsIntent', slots)
+        response = LF1.lambda_handler(event, None)
+        yield event, response
+        slots = dict(response['dialogAction']['slots'])
+    event = bench.lex_event('DiningSuggestionsIntent', slots, source='FulfillmentCodeHook')
+    yield event, LF1.lambda_handler(event, None)
+
+
+class LoadRun(object):
+    """
+    one load run: producers through LF1, consumers through LF2, a depth sampler
+    """
+
+    def __init__(self, LF1, LF2, backend, queue_url, sample_interval=0.1):
+        self.LF1 = LF1
+        self.LF2 = LF2
+        self.backend = backend
+        self.queue = backend.sqs.queue(queue_url)
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.turn_samples = []
+        self.errors = 0
+        self.consumer_errors = 0
+        self.depth_samples = []
+        self.started = None
+        self.producing = threading.Event()
+        self.stopped = threading.Event()
+
+    def run_session(self, fills):
+        turns = session_events(self.LF1, fills)
+        while True:
+            t = time.perf_counter()
+            try:
+                next(turns)
+            except StopIteration:
+                return
+            except Exception:
+                with self.lock:
+                    self.errors += 1
+                return
+            with self.lock:
+                self.turn_samples.append(time.perf_counter() - t)
+
+    def consume(self, interval):
+        while not self.stopped.is_set():
+            try:
+                response = self.LF2.lambda_handler({}, None)
+            except Exception:
+                with self.lock:
+                    self.consumer_errors += 1
+                continue
+            if response['body'].startswith('No message'):
+                if not self.producing.is_set() and self.queue.depth() == 0:
+                    return
+                time.sleep(interval or 0.001)
+            elif interval:
+                time.sleep(interval)
+
+    def sample_depth(self):
+        while not self.stopped.is_set():
+            self.depth_samples.append((round(time.perf_counter() - self.started, 3), self.queue.depth(),
+                                       self.queue.sent, self.queue.deleted))
+            time.sleep(self.sample_interval)
+
+    def produce(self, pool, sessions, rate, burst_size, burst_interval):
+        """
+        paced: one session every 1/rate seconds; burst: burst_size sessions every burst_interval
+        """
+        futures = []
+        if burst_size:
+            for start in range(0, len(sessions), burst_size):
+                for fills in sessions[start:start + burst_size]:
+                    futures.append(pool.submit(self.run_session, fills))
+                time.sleep(burst_interval)
+        else:
+            begin = time.perf_counter()
+            for i, fills in enumerate(sessions):
+                delay = begin + i / float(rate) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(self.run_session, fills))
+        for future in futures:
+            future.result()
+
+    def run(self, sessions, rate, burst_size, burst_interval, concurrency, consumers,
+            consumer_interval, drain_timeout):
+        self.started = time.perf_counter()
+        self.producing.set()
+        sampler = threading.Thread(target=self.sample_depth)
+        sampler.start()
+
+        with bench.quiet():
+            consumer_threads = [threading.Thread(target=self.consume, args=(consumer_interval,))
+                                for _ in range(consumers)]
+            for thread in consumer_threads:
+                thread.start()
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                self.produce(pool, sessions, rate, burst_size, burst_interval)
+            produced_at = time.perf_counter()
+            self.producing.clear()
+
+            deadline = produced_at + drain_timeout
+            for thread in consumer_threads:
+                thread.join(max(0.0, deadline - time.perf_counter()))
+            drained_at = time.perf_counter()
+            self.stopped.set()
+            for thread in consumer_threads:
+                thread.join()
+        sampler.join()
+
+        return self.report(produced_at - self.started, drained_at - self.started, consumers)
+
+    def report(self, produce_seconds, total_seconds, consumers):
+        depths = [d for _, d, _, _ in self.depth_samples]
+        during = [(t, d) for t, d, _, _ in self.depth_samples if t <= produce_seconds]
+        return {
+            'sessions_enqueued': self.queue.sent,
+            'messages_deleted': self.queue.deleted,
+            'emails_sent': len(self.backend.ses.sent),
+            # LF2 receives with VisibilityTimeout=0, so concurrent consumers can get the same message
+            'duplicate_emails': max(0, len(self.backend.ses.sent) - self.queue.deleted),
+            'lf1_errors': self.errors,
+            'lf2_errors': self.consumer_errors,
+            'produce_seconds': round(produce_seconds, 3),
+            'total_seconds': round(total_seconds, 3),
+            'enqueue_rate_per_s': round(self.queue.sent / produce_seconds, 2) if produce_seconds else None,
+            'drain_rate_per_s': round(self.queue.deleted / total_seconds, 2) if total_seconds else None,
+            'drain_rate_per_consumer_per_s': round(self.queue.deleted / total_seconds / consumers, 2)
+            if total_seconds and consumers else None,
+            'depth_growth_per_s': slope(during),
+            'max_depth': max(depths) if depths else 0,
+            'final_depth': self.queue.depth(),
+            'lf1_turns': bench.summarize(self.turn_samples, total_seconds),
+            'depth_samples': [{'t': t, 'depth': d, 'sent': s, 'deleted': x}
+                              for t, d, s, x in self.depth_samples],
+        }
+
+
+def slope(points):
+    """
+    least squares slope of (t, value) points, in value per second
+    """
+    if len(points) < 2:
+        return None
+    n = float(len(points))
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if not var:
+        return None
+    return round(sum((t - mean_t) * (v - mean_v) for t, v in points) / var, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic Lex dialog load through LF1 into the local queue.')
+    parser.add_argument('--rate', type=float, default=20.0, help='sessions started per second (paced mode)')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of load (paced mode)')
+    parser.add_argument('--burst-size', type=int, default=0, help='sessions per open-loop burst, 0 for paced')
+    parser.add_argument('--burst-interval', type=float, default=1.0, help='seconds between bursts')
+    parser.add_argument('--bursts', type=int, default=5, help='number of bursts')
+    parser.add_argument('--concurrency', type=int, default=32, help='sessions in flight at most')
+    parser.add_argument('--consumers', type=int, default=1, help='concurrent LF2 consumers')
+    parser.add_argument('--consumer-interval', type=float, default=0.0,
+                        help='seconds each consumer waits between LF2 invocations')
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help='seconds consumers may keep draining after the load stops')
+    parser.add_argument('--invalid-ratio', type=float, default=0.2,
+                        help='chance that a slot is first filled with an invalid value')
+    parser.add_argument('--catalog-size', type=int, default=1000, help='restaurants loaded for LF2')
+    parser.add_argument('--latency', default='', help='injected latency per service in ms, e.g. sqs=5,ses=20')
+    parser.add_argument('--jitter', type=float, default=0.0, help='relative latency jitter, e.g. 0.2')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='loadgen_results.json', help='JSON results file')
+    args = parser.parse_args(argv)
+
+    latency = bench.parse_latency(args.latency)
+    backend = backends.LocalBackend(backends.Latency(latency, jitter=args.jitter, seed=args.seed))
+    LF0, LF1, LF2, scraper = bench.load_handlers(backend)
+    cuisines = list(scraper.catalog.CUISINE_NAMES)
+    bench.bench_ingest(scraper, backend, args.catalog_size, cuisines)
+
+    rng = random.Random(args.seed)
+    variants = cuisine_variants(LF1.catalog)
+    if args.burst_size:
+        n_sessions = args.burst_size * args.bursts
+    else:
+        n_sessions = int(args.rate * args.duration)
+    sessions = [make_session(rng, variants, args.invalid_ratio, i) for i in range(n_sessions)]
+
+    load = LoadRun(LF1, LF2, backend, LF1.QUEUE_URL)
+    result = load.run(sessions, args.rate, args.burst_size, args.burst_interval, args.concurrency,
+                      args.consumers, args.consumer_interval, args.drain_timeout)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': dict(vars(args), latency=backend.latency.latency_ms),
+        'turns_per_session': round(len(load.turn_samples) / float(len(sessions)), 2) if sessions else 0,
+        'result': result,
+    }
+    with open(args.output, 'w') as json_file:
+        json.dump(report, json_file, indent=4)
+
+    summary = {k: v for k, v in result.items() if k not in ('depth_samples', 'lf1_turns')}
+    for key, value in summary.items():
+        print('{:<32} {}'.format(key, value))
+    print('{:<32} p50 {} ms, p99 {} ms'.format('lf1_turn_latency', result['lf1_turns']['p50_ms'],
+                                               result['lf1_turns']['p99_ms']))
+    print('\nResults written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+import uuid
+
+import yelp_scraper
+from lambda_functions import catalog
+
+"""
+Sharded multi-city crawl of Yelp, the parallel version of yelp_scrape.
+
+The plan is every catalog location x cuisine, optionally split into tiles
+over the location's bounding box. Each shard is a row of a local SQLite work
+queue. Worker processes lease shards, page through them and record progress
+after every page, so a shard whose worker dies is picked up again where it
+stopped once its lease expires. Failed pages are retried up to --max-attempts
+times. All workers share one rate limit through the same database. Results
+are merged into one deduplicated snapshot in the yelp_scrape JSON format,
+ready for DynamoDB_store and OpenSearch_store.
+
+Usage:
+
+    python crawler.py --workers 4 --rate 5 --tiles 2 --output restaurants_info.json
+
+Re-running with the same --db resumes the crawl.
+"""
+
+# Yelp returns at most 1000 results per query, i.e. offset + limit <= 1000
+MAX_OFFSET = 1000 - yelp_scraper.SEARCH_LIMIT
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    location TEXT NOT NULL,
+    cuisine TEXT NOT NULL,
+    tile INTEGER NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    radius INTEGER,
+    state TEXT NOT NULL DEFAULT 'pending',
+    next_offset INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    businesses INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (location, cuisine, tile)
+);
+CREATE TABLE IF NOT EXISTS results (
+    business_id TEXT NOT NULL,
+    cuisine TEXT NOT NULL,
+    shard_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (business_id, cuisine)
+);
+CREATE TABLE IF NOT EXISTS rate_limit (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    next_slot REAL NOT NULL
+);
+INSERT OR IGNORE INTO rate_limit (id, next_slot) VALUES (1, 0);
+'''
+
+
+def connect(db_path):
+    """
+    SQLite connection shared by nobody: every process opens its own
+    """
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+""" --- Plan --- """
+
+
+def tiles(location, n):
+    """
+    (latitude, longitude, radius in m) of an n x n grid over the location's
+    bounding box, or a single (None, None, None) tile that searches by name
+    """
+    if n <= 1 or location not in catalog.LOCATION_BOUNDARIES:
+        return [(None, None, None)]
+
+    (south, west, north, east), _ = catalog.LOCATION_BOUNDARIES[location]
+    d_lat = (north - south) / n
+    d_lon = (east - west) / n
+    # half the tile diagonal, so the search circle covers the whole tile
+    height = d_lat * 111320.0
+    width = d_lon * 111320.0 * math.cos(math.radians((north + south) / 2))
+    radius = int(math.ceil(math.hypot(height, width) / 2))
+    return [(south + (i + 0.5) * d_lat, west + (j + 0.5) * d_lon, radius)
+            for i in range(n) for j in range(n)]
+
+
+def plan(conn, locations, cuisines, n_tiles):
+    """
+    insert one shard per location x cuisine x tile, existing shards are kept
+    """
+    rows = []
+    for location in locations:
+        for tile, (lat, lon, radius) in enumerate(tiles(location, n_tiles)):
+            for cuisine in cuisines:
+                rows.append((location, cuisine, tile, lat, lon, radius))
+    conn.executemany('INSERT OR IGNORE INTO shards (location, cuisine, tile, latitude, longitude, radius) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+
+""" --- Leases and rate limit --- """
+
+
+def lease(conn, owner, lease_seconds, max_attempts):
+    """
+    claim the next pending shard, or a leased one whose lease expired
+    """
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # a worker died on the last attempt of these, nobody may retry them
+        conn.execute("UPDATE shards SET state = 'failed', lease_owner = NULL, "
+                     "error = COALESCE(error, 'lease expired on the last attempt') "
+                     "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, max_attempts))
+        row = conn.execute(
+            "SELECT id, location, cuisine, latitude, longitude, radius, next_offset FROM shards "
+            "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND attempts < ? "
+            "ORDER BY id LIMIT 1", (now, max_attempts)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE shards SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                         "attempts = attempts + 1 WHERE id = ?", (owner, now + lease_seconds, row[0]))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return row
+
+
+def wait_for_slot(conn, rate):
+    """
+    block until this process may send the next request, at most `rate` per second overall
+    """
+    if rate <= 0:
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        next_slot = conn.execute('SELECT next_slot FROM rate_limit WHERE id = 1').fetchone()[0]
+        slot = max(time.time(), next_slot)
+        conn.execute('UPDATE rate_limit SET next_slot = ? WHERE id = 1', (slot + 1.0 / rate,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    delay = slot - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+""" --- Workers --- """
+
+
+def crawl_shard(conn, owner, shard, options):
+    """
+    page through one shard, recording results and progress after every page
+    """
+    shard_id, location, cuisine, lat, lon, radius, offset = shard
+    term = cuisine + ' restaurants'
+    query = catalog.LOCATION_QUERIES.get(location, location)
+
+    while offset <= options['max_offset']:
+        wait_for_slot(conn, options['rate'])
+        start = time.time()
+        try:
+            response = yelp_scraper.search(yelp_scraper.API_KEY, term, query, offset, lat, lon, radius)
+            if 'error' in response:
+                raise RuntimeError(json.dumps(response['error']))
+        except Exception as error:
+            # back to pending for another attempt, failed once attempts run out
+            conn.execute("UPDATE shards SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                         "lease_owner = NULL, error = ?, requests = requests + 1, seconds = seconds + ? "
+                         "WHERE id = ? AND lease_owner = ?",
+                         (options['max_attempts'], str(error)[:500], time.time() - start, shard_id, owner))
+            return False
+
+        businesses = response.get('businesses') or []
+        offset += yelp_scraper.SEARCH_LIMIT
+        done = len(businesses) < yelp_scraper.SEARCH_LIMIT or offset > options['max_offset']
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR IGNORE INTO results (business_id, cuisine, shard_id, data) '
+                             'VALUES (?, ?, ?, ?)',
+                             [(b['id'], cuisine, shard_id, json.dumps(b)) for b in businesses])
+            cursor = conn.execute(
+                "UPDATE shards SET next_offset = ?, requests = requests + 1, businesses = businesses + ?, "
+                "seconds = seconds + ?, lease_expires = ?, error = NULL, state = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                (offset, len(businesses), time.time() - start, time.time() + options['lease_seconds'],
+                 'done' if done else 'leased', shard_id, owner))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if cursor.rowcount == 0:
+            # the lease expired and another worker owns the shard now
+            return False
+        if done:
+            return True
+    return True
+
+
+def crawl_worker(db_path, options):
+    """
+    lease and crawl shards until none is left
+    """
+    yelp_scraper.VERBOSE = False
+    conn = connect(db_path)
+    owner = '{}-{}'.format(os.getpid(), uuid.uuid4().hex[:8])
+    while True:
+        shard = lease(conn, owner, options['lease_seconds'], options['max_attempts'])
+        if shard is None:
+            # nothing to lease, but leased shards may still come back when their lease expires
+            busy = conn.execute("SELECT COUNT(*) FROM shards WHERE "
+                                "(state = 'leased' AND NOT (lease_expires < ? AND attempts >= ?)) OR "
+                                "(state = 'pending' AND attempts < ?)",
+                                (time.time(), options['max_attempts'], options['max_attempts'])).fetchone()[0]
+            if not busy:
+                break
+            time.sleep(min(1.0, options['lease_seconds']))
+            continue
+        crawl_shard(conn, owner, shard, options)
+    conn.close()
+
+
+""" --- Snapshot and report --- """
+
+
+def snapshot(conn):
+    """
+    one entry per business with all its cuisines, as yelp_scrape writes them
+    """
+    restaurants = dict()
+    for business_id, cuisine, data in conn.execute(
+            'SELECT business_id, cuisine, data FROM results ORDER BY shard_id, rowid'):
+        if business_id not in restaurants:
+            business = json.loads(data)
+            business['cuisine'] = [cuisine]
+            restaurants[business_id] = business
+        elif cuisine not in restaurants[business_id]['cuisine']:
+            restaurants[business_id]['cuisine'].append(cuisine)
+    return restaurants
+
+
+def progress(conn):
+    """
+    per shard progress rows and totals
+    """
+    shards = []
+    for row in conn.execute('SELECT id, location, cuisine, tile, state, next_offset, attempts, requests, '
+                            'businesses, seconds, error FROM shards ORDER BY id'):
+        shard = dict(zip(('id', 'location', 'cuisine', 'tile', 'state', 'next_offset', 'attempts',
+                          'requests', 'businesses', 'seconds', 'error'), row))
+        shard['businesses_per_s'] = round(shard['businesses'] / shard['seconds'], 1) if shard['seconds'] else None
+        shards.append(shard)
+
+    states = {}
+    for shard in shards:
+        states[shard['state']] = states.get(shard['state'], 0) + 1
+    unique = conn.execute('SELECT COUNT(DISTINCT business_id) FROM results').fetchone()[0]
+    return {
+        'shards': shards,
+        'states': states,
+        'requests': sum(s['requests'] for s in shards),
+        'businesses': sum(s['businesses'] for s in shards),
+        'unique_businesses': unique,
+    }
+
+
+def print_progress(report, elapsed, verbose=False):
+    print('[{:.0f}s] shards {} | {} requests ({:.1f}/s) | {} businesses, {} unique'.format(
+        elapsed, ', '.join('{} {}'.format(n, state) for state, n in sorted(report['states'].items())),
+        report['requests'], report['requests'] / elapsed if elapsed else 0.0,
+        report['businesses'], report['unique_businesses']))
+    if verbose:
+        print('{:>5} {:<12} {:<12} {:>4} {:<8} {:>6} {:>8} {:>10} {:>8}'.format(
+            'shard', 'location', 'cuisine', 'tile', 'state', 'tries', 'requests', 'businesses', 'biz/s'))
+        for s in report['shards']:
+            print('{:>5} {:<12} {:<12} {:>4} {:<8} {:>6} {:>8} {:>10} {:>8}'.format(
+                s['id'], s['location'], s['cuisine'], s['tile'], s['state'], s['attempts'], s['requests'],
+                s['businesses'], s['businesses_per_s'] if s['businesses_per_s'] is not None else '-'))
+
+
+def crawl(db_path, file_path, workers=4, rate=5.0, n_tiles=1, locations=None, cuisines=None,
+          lease_seconds=60.0, max_attempts=3, max_offset=MAX_OFFSET, report_every=10.0):
+    """
+    plan the shards, crawl them with `workers` processes and write the merged snapshot
+    """
+    options = {
+        'rate': rate,
+        'lease_seconds': lease_seconds,
+        'max_attempts': max_attempts,
+        'max_offset': max_offset,
+    }
+    conn = connect(db_path)
+    conn.executescript(SCHEMA)
+    n_shards = plan(conn, locations or catalog.LOCATION_NAMES, cuisines or catalog.CUISINE_NAMES, n_tiles)
+
+    start_time = time.time()
+    print("---------- Start crawling {} shards with {} workers ----------\n".format(n_shards, workers))
+
+    processes = [multiprocessing.Process(target=crawl_worker, args=(db_path, options)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    while any(process.is_alive() for process in processes):
+        for process in processes:
+            process.join(report_every / len(processes))
+        if any(process.is_alive() for process in processes):
+            print_progress(progress(conn), time.time() - start_time)
+
+    report = progress(conn)
+    print_progress(report, time.time() - start_time, verbose=True)
+
+    restaurants = snapshot(conn)
+    conn.close()
+    with open(file_path, 'w') as json_file:
+        json_file.write(json.dumps(restaurants, indent=4))
+
+    time_elapsed = time.time() - start_time
+    print("\nCrawling data runs {:.0f}m {:.0f}s".format(time_elapsed // 60, time_elapsed % 60))
+    print("---------- End crawling, {} restaurants written to {} ----------\n".format(len(restaurants), file_path))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sharded multi-city Yelp crawl with a local work queue.')
+    parser.add_argument('--db', default='crawl.sqlite', help='SQLite work queue, reused to resume a crawl')
+    parser.add_argument('--output', default='restaurants_info.json', help='merged snapshot JSON file')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes')
+    parser.add_argument('--rate', type=float, default=5.0, help='requests per second across all workers')
+    parser.add_argument('--tiles', type=int, default=1, help='split each location into an N x N grid')
+    parser.add_argument('--locations', default='', help='comma separated catalog locations, default all')
+    parser.add_argument('--cuisines', default='', help='comma separated catalog cuisines, default all')
+    parser.add_argument('--lease-seconds', type=float, default=60.0,
+                        help='seconds before a shard of a silent worker is handed to another one')
+    parser.add_argument('--max-attempts', type=int, default=3, help='attempts per shard before it fails')
+    parser.add_argument('--max-offset', type=int, default=MAX_OFFSET, help='deepest result offset per shard')
+    parser.add_argument('--report-every', type=float, default=10.0, help='seconds between progress lines')
+    args = parser.parse_args(argv)
+
+    locations = [l.strip().lower() for l in args.locations.split(',') if l.strip()]
+    cuisines = [c.strip().lower() for c in args.cuisines.split(',') if c.strip()]
+    unknown = [l for l in locations if l not in catalog.LOCATIONS] + [c for c in cuisines if c not in catalog.CUISINES]
+    if unknown:
+        parser.error('not in the catalog: {}'.format(', '.join(unknown)))
+
+    crawl(args.db, args.output, args.workers, args.rate, args.tiles, locations, cuisines,
+          args.lease_seconds, args.max_attempts, args.max_offset, args.report_every)
+
+
+if __name__ == '__main__':
+    main()
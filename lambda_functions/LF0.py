@@ -1,8 +1,16 @@
+import coldstart
+COLD_START = coldstart.ColdStart('LF0')
+
 import json
 import boto3
 
-# Define the client to interact with Lex
-client = boto3.client('lex-runtime')
+import metrics
+
+METRICS = metrics.Metrics('LF0')
+
+# Define the client to interact with Lex, once per container
+with COLD_START.phase('lex_client'):
+    client = boto3.client('lex-runtime')
 
 
 def lambda_handler(event, context):
@@ -11,15 +19,20 @@ def lambda_handler(event, context):
 
     print(f"Message from frontend: {msg_from_user}")
 
-    response = client.post_text(botName='DiningConcierge',
-                                botAlias='dine',
-                                userId='testuser',
-                                inputText=msg_from_user)
-    
+    METRICS.begin()
+    try:
+        with METRICS.span('lex_call'):
+            response = client.post_text(botName='DiningConcierge',
+                                        botAlias='dine',
+                                        userId='testuser',
+                                        inputText=msg_from_user)
+    finally:
+        METRICS.flush()
+        COLD_START.report()
+
     msg_from_lex = response['message']
     if msg_from_lex:
         print(f"Message from Chatbot: {msg_from_lex}")
-        print(response)
 
         resp = {
             'statusCode': 200,
@@ -37,3 +50,5 @@ def lambda_handler(event, context):
 
         return resp
 
+
+COLD_START.imported()
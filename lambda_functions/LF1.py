@@ -1,16 +1,26 @@
+import coldstart
+COLD_START = coldstart.ColdStart('LF1')
+
 import json
-import boto3
-import dateutil.parser
 import datetime
-import math
 import time
 import os
 import re
 import logging
 
+import catalog
+import metrics
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
+METRICS = metrics.Metrics('LF1')
+
+# set the default time zone, once per container
+with COLD_START.phase('tzset'):
+    os.environ['TZ'] = 'America/New_York'
+    time.tzset()
+
 """
 Reference sample codes:
     https://github.com/amazon-archives/serverless-app-examples/blob/master/python/lex-order-flowers-python/lambda_function.py
@@ -91,95 +101,150 @@ def build_validation_result(is_valid, violated_slot, message_content):
 
 
 def isvalid_date(date):
+    # only the Date slot needs dateutil, greeting turns never load it
+    parser = COLD_START.lazy_import('dateutil.parser')
     try:
-        dateutil.parser.parse(date)
+        parser.parse(date)
         return True
     except ValueError:
         return False
 
 
-def parse_int(n):
-    try:
-        return int(n)
-    except ValueError:
-        return float('nan')
+""" --- Slot validators --- """
+
+# built once per container, reused by every invocation
+LOCATION_MESSAGE = 'We currently do not support suggestions for restaurant in {}. ' \
+                   'Could you try ' + catalog.display_list(catalog.LOCATION_NAMES) + '?'
+CUISINE_MESSAGE = 'We currently do not support suggestions for {} restaurants. ' \
+                  'Please choose one from the following: ' + catalog.display_list(catalog.CUISINE_NAMES) + '. '
+NUMBER_PATTERN = re.compile(r'^\d+$')
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+TIME_PATTERN = re.compile(r'^(\d{2}):(\d{2})$')
+
 
+def validate_location(location):
+    if location.lower() not in catalog.LOCATIONS:
+        return build_validation_result(False, 'Location', LOCATION_MESSAGE.format(location))
 
-def validate_dining_suggestions(location, cuisine, num_of_people,
-                                date, time, email):
+
+def validate_cuisine(cuisine):
+    if cuisine.lower() not in catalog.CUISINES:
+        return build_validation_result(False, 'Cuisine', CUISINE_MESSAGE.format(cuisine))
+
+
+def validate_num_of_people(num_of_people):
     """
-    make validations on DiningSuggestionsIntent input data
+    int number >= 1
     """
+    if not NUMBER_PATTERN.match(num_of_people) or int(num_of_people) < 1:
+        return build_validation_result(
+            False,
+            'NumberOfPeople',
+            'Please enter a valid number for people.'
+        )
 
-    # check location
-    locations = ['manhattan']
-    if location is not None and location.lower() not in locations:
+
+def validate_date(date):
+    """
+    1. valid date
+    2. date not in the past
+    """
+    if not DATE_PATTERN.match(date) or not isvalid_date(date):
         return build_validation_result(
             False,
-            'Location',
-            'We currently do not support suggestions for restaurant in {}. Could you try Manhattan?'.format(location))
+            'Date',
+            'Please enter a valid date in the format: yyyy-mm-dd.'
+        )
+    if datetime.datetime.strptime(date, '%Y-%m-%d').date() < datetime.date.today():
+        return build_validation_result(
+            False,
+            'Date',
+            'This date is in the past. Please enter a date from today onwards.'
+        )
 
-    # check cuisine types
-    cuisine_types = ['chinese', 'japanese', 'thai', 'italian', 'american', 'mexican', 'vietnamese', 'korean']
-    if cuisine is not None and cuisine.lower() not in cuisine_types:
+
+def validate_time(time):
+    """
+    1. valid time
+    2. 7:00 - 24:00 open hours
+    """
+    match = TIME_PATTERN.match(time)
+    if match is None:
+        return build_validation_result(False, 'Time', None)
+
+    if 0 < int(match.group(1)) < 7:
         return build_validation_result(
             False,
-            'Cuisine',
-            'We currently do not support suggestions for {} restaurants. '.format(cuisine) +
-            'Please choose one from the following: Chinese, Japanese, Thai, Italian, American, Mexican, Vietnamese, '
-            'Korean. '
+            'Time',
+            'Please enter a time between the open hours from 7:00 to 24:00.'
         )
 
-    # check number of people
-    # 1. int number >= 1
-    if num_of_people is not None:
-        if not num_of_people.isnumeric() or int(num_of_people) < 1:
-            return build_validation_result(
-                False,
-                'NumberOfPeople',
-                'Please enter a valid number for people.'
-            )
-
-    # check date
-    # 1. valid date
-    # 2. date not in the past
-    if date is not None:
-        if not isvalid_date(date):
-            return build_validation_result(
-                False,
-                'Date',
-                'Please enter a valid date in the format: yyyy-mm-dd.'
-            )
-        elif datetime.datetime.strptime(date, '%Y-%m-%d').date() < datetime.date.today():
-            return build_validation_result(
-                False,
-                'Date',
-                'This date is in the past. Please enter a date from today onwards.'
-            )
-
-    # check time
-    # 1. valid time
-    # 2. 7:00 - 24:00 open hours
-    if time is not None:
-        if len(time) != 5:
-            return build_validation_result(False, 'Time', None)
-
-        hour, minute = time.split(':')
-        hour = parse_int(hour)
-        minute = parse_int(minute)
-        if math.isnan(hour) or math.isnan(minute):
-            return build_validation_result(False, 'Time', None)
-
-        if 0 < hour < 7:
-            return build_validation_result(
-                False,
-                'Time',
-                'Please enter a time between the open hours from 7:00 to 24:00.'
-            )
+
+def normalize_location(location):
+    return catalog.normalize(catalog.LOCATION_INDEX, location)
+
+
+def normalize_cuisine(cuisine):
+    return catalog.normalize(catalog.CUISINE_INDEX, cuisine)
+
+
+# free-text slots rewritten to their canonical catalog name before validation,
+# a normalizer returns None when it is not confident and the value is kept as is
+SLOT_NORMALIZERS = {
+    'DiningSuggestionsIntent': {
+        'Location': normalize_location,
+        'Cuisine': normalize_cuisine,
+    },
+}
+
+# slot rules per intent, checked in order; the first failing rule is elicited again
+SLOT_RULES = {
+    'DiningSuggestionsIntent': (
+        ('Location', validate_location),
+        ('Cuisine', validate_cuisine),
+        ('NumberOfPeople', validate_num_of_people),
+        ('Date', validate_date),
+        ('Time', validate_time),
+    ),
+}
+
+
+def normalize_slots(slots, normalizers):
+    """
+    rewrite confidently matched slot values in place
+    """
+    for slot_name, normalizer in normalizers.items():
+        value = slots.get(slot_name)
+        if value is None:
+            continue
+        normalized = normalizer(value)
+        if normalized is not None:
+            slots[slot_name] = normalized
+
+
+def validate_slots(slots, rules):
+    """
+    run the slot rules on the filled slots, stop at the first violation
+    """
+    for slot_name, validator in rules:
+        value = slots.get(slot_name)
+        if value is None:
+            continue
+        result = validator(value)
+        if result is not None:
+            return result
 
     return build_validation_result(True, None, None)
 
 
+def validate_dining_suggestions(slots):
+    """
+    make validations on DiningSuggestionsIntent input data
+    """
+    normalize_slots(slots, SLOT_NORMALIZERS['DiningSuggestionsIntent'])
+    return validate_slots(slots, SLOT_RULES['DiningSuggestionsIntent'])
+
+
 """ --- Functions that control the bot's behavior --- """
 
 
@@ -211,21 +276,14 @@ def dining_suggestions(intent_request):
     """
     DiningSuggestionsIntent
     """
-    # get the slots' info
-    location = get_slots(intent_request)['Location']
-    cuisine = get_slots(intent_request)['Cuisine']
-    num_of_people = get_slots(intent_request)['NumberOfPeople']
-    date = get_slots(intent_request)['Date']
-    time = get_slots(intent_request)['Time']
-    email = get_slots(intent_request)['Email']
     source = intent_request['invocationSource']
 
     if source == 'DialogCodeHook':
         # validate inputs
         slots = get_slots(intent_request)
         #logger.debug(slots)
-        validation_result = validate_dining_suggestions(location, cuisine, num_of_people,
-                                                        date, time, email)
+        with METRICS.span('validation'):
+            validation_result = validate_dining_suggestions(slots)
 
         # Not valid inputs
         if not validation_result['isValid']:
@@ -234,13 +292,14 @@ def dining_suggestions(intent_request):
                                intent_request['currentIntent']['name'],
                                slots,
                                validation_result['violatedSlot'],
-                               validation_result['message'])
+                               validation_result.get('message'))
 
         output_session_attributes = intent_request['sessionAttributes']
         return delegate(output_session_attributes, get_slots(intent_request))
 
     # push the valid info to an SQS queue
-    SQS_send(get_slots(intent_request))
+    with METRICS.span('sqs_send'):
+        SQS_send(get_slots(intent_request))
 
     # request received confirmation message
     return close(intent_request['sessionAttributes'],
@@ -253,51 +312,115 @@ def dining_suggestions(intent_request):
 
 """ --- SQS queues --- """
 
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/414199463068/RestaurantRequest"
+
+_sqs = None
+
+
+def sqs_client():
+    """
+    SQS client created on the first fulfillment and reused by the container
+    """
+    global _sqs
+    if _sqs is None:
+        boto3 = COLD_START.lazy_import('boto3')
+        with COLD_START.phase('sqs_client'):
+            _sqs = boto3.client('sqs')
+    return _sqs
+
+
+# version 1 body: {"v": 1, "Location": ..., "Cuisine": ..., ...}, missing slots are null;
+# Latitude/Longitude are the user's own coordinates, LF2 ranks restaurants by distance from them
+MESSAGE_SCHEMA_VERSION = 1
+MESSAGE_SLOTS = ('Location', 'Cuisine', 'NumberOfPeople', 'Date', 'Time', 'Email', 'Latitude', 'Longitude')
+MAX_BATCH_SIZE = 10
+
+
+def encode_request(data):
+    """
+    compact JSON message body for one request, decoded by LF2.decode_request
+    """
+    body = {'v': MESSAGE_SCHEMA_VERSION}
+    for slot in MESSAGE_SLOTS:
+        body[slot] = data.get(slot)
+    return json.dumps(body, separators=(',', ':'))
+
 
 def SQS_send(data):
     """
     push the collected info from the user to an SQS queue
     """
-    sqs = boto3.client('sqs')
-
-    queue_url = "https://sqs.us-east-1.amazonaws.com/414199463068/RestaurantRequest"
+    sqs = sqs_client()
 
     response = sqs.send_message(
-        QueueUrl=queue_url,
-        MessageAttributes={
-            'Location': {
-                'DataType': 'String',
-                'StringValue': data['Location']
-            },
-            'Cuisine': {
-                'DataType': 'String',
-                'StringValue': data['Cuisine']
-            },
-            'NumberOfPeople': {
-                'DataType': 'String',
-                'StringValue': data['NumberOfPeople']
-            },
-            'Date': {
-                'DataType': 'String',
-                'StringValue': data['Date']
-            },
-            'Time': {
-                'DataType': 'String',
-                'StringValue': data['Time']
-            },
-            'Email': {
-                'DataType': 'String',
-                'StringValue': data['Email']
-            }
-        },
-        MessageBody='user restaurant request'
+        QueueUrl=QUEUE_URL,
+        MessageBody=encode_request(data)
     )
 
-    logger.debug(response)
+    logger.debug('sent message {}'.format(response['MessageId']))
+
+
+class SQSBatchSender(object):
+    """
+    Buffer requests and push them with send_message_batch, up to 10 per call.
+
+    The buffer is flushed when it is full and on flush(), also when used as a
+    context manager. flush() returns the failed entries reported by SQS, their
+    Id is the position of the request in the order it was added.
+    """
+
+    def __init__(self, batch_size=MAX_BATCH_SIZE):
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.buffer = []
+        self.added = 0
+        self.failed = []
+
+    def add(self, data):
+        self.buffer.append({'Id': str(self.added), 'MessageBody': encode_request(data)})
+        self.added += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            entries, self.buffer = self.buffer, []
+            try:
+                response = sqs_client().send_message_batch(QueueUrl=QUEUE_URL, Entries=entries)
+            except Exception:
+                # keep the requests for the next flush
+                self.buffer = entries + self.buffer
+                raise
+            failed = response.get('Failed', [])
+            if failed:
+                logger.error('failed to send {} of {} messages'.format(len(failed), len(entries)))
+            self.failed.extend(failed)
+        return self.failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def SQS_send_batch(requests):
+    """
+    push several requests with as few SQS calls as possible, return the failed entries
+    """
+    with SQSBatchSender() as sender:
+        for data in requests:
+            sender.add(data)
+    return sender.failed
 
 
 """ --- Intents --- """
 
+INTENT_HANDLERS = {
+    'GreetingIntent': greeting,
+    'ThankYouIntent': thank_you,
+    'DiningSuggestionsIntent': dining_suggestions,
+}
+
 
 def dispatch(intent_request):
     """
@@ -305,14 +428,11 @@ def dispatch(intent_request):
     """
     intent_name = intent_request['currentIntent']['name']
 
-    if intent_name == 'GreetingIntent':
-        return greeting(intent_request)
-    elif intent_name == 'ThankYouIntent':
-        return thank_you(intent_request)
-    elif intent_name == 'DiningSuggestionsIntent':
-        return dining_suggestions(intent_request)
+    handler = INTENT_HANDLERS.get(intent_name)
+    if handler is None:
+        raise Exception('Intent with name ' + intent_name + ' not supported')
 
-    raise Exception('Intent with name ' + intent_name + ' not supported')
+    return handler(intent_request)
 
 
 """ --- Main handler --- """
@@ -322,10 +442,15 @@ def lambda_handler(event, context):
     """
     main handler of events
     """
-    # set the default time zone
-    os.environ['TZ'] = 'America/New_York'
-    time.tzset()
-
     logger.debug('event.bot.name={}'.format(event['bot']['name']))
 
-    return dispatch(event)
+    METRICS.begin()
+    try:
+        response = dispatch(event)
+    finally:
+        METRICS.flush()
+        COLD_START.report()
+    return response
+
+
+COLD_START.imported()
@@ -1,3 +1,6 @@
+import coldstart
+COLD_START = coldstart.ColdStart('LF2')
+
 import json
 import boto3
 import datetime
@@ -5,13 +8,16 @@ import math
 import time
 import os
 import logging
-import random
-from opensearchpy import OpenSearch, RequestsHttpConnection
 from botocore.exceptions import ClientError
 
+import metrics
+import sampling
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
+METRICS = metrics.Metrics('LF2')
+
 
 """
 Reference sample codes:
@@ -20,24 +26,71 @@ Reference sample codes:
 """
 
 
+""" --- Clients, created on first use and reused by the container --- """
+
+_clients = {}
+
+
+def aws_client(service, **kwargs):
+    """
+    boto3 client per service
+    """
+    if service not in _clients:
+        with COLD_START.phase(service + '_client'):
+            _clients[service] = boto3.client(service, **kwargs)
+    return _clients[service]
+
+
+def dynamodb_table(name='yelp-restaurants'):
+    """
+    table in DynamoDB, the restaurants table by default
+    """
+    key = 'dynamodb:' + name
+    if key not in _clients:
+        with COLD_START.phase('dynamodb_resource'):
+            _clients[key] = boto3.resource('dynamodb').Table(name)
+    return _clients[key]
+
+
+def opensearch_client():
+    """
+    OpenSearch client, opensearchpy is only imported when a message needs a search
+    """
+    if 'opensearch' not in _clients:
+        opensearchpy = COLD_START.lazy_import('opensearchpy')
+
+        auth = ('master', '6998Cloud!')
+        host = 'search-restaurants-6iggou56o64jxdkwcb7xb2iks4.us-east-1.es.amazonaws.com'
+
+        with COLD_START.phase('opensearch_client'):
+            _clients['opensearch'] = opensearchpy.OpenSearch(
+                hosts=[{'host': host, 'port': 443}],
+                http_auth=auth,
+                use_ssl=True,
+                verify_certs=True,
+                connection_class=opensearchpy.RequestsHttpConnection
+            )
+    return _clients['opensearch']
+
+
+""" --- SQS queues --- """
+
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/414199463068/RestaurantRequest"
+
+
 def SQS_pull(max_num_msg):
     """
     pull messages from the SQS queue
     """
-    sqs = boto3.client('sqs')
-    queue_url = "https://sqs.us-east-1.amazonaws.com/414199463068/RestaurantRequest"
-
+    sqs = aws_client('sqs')
     response = sqs.receive_message(
-        QueueUrl=queue_url,
-        AttributeNames=['All'],
+        QueueUrl=QUEUE_URL,
         MessageAttributeNames=['All'],
         MaxNumberOfMessages=max_num_msg,
         VisibilityTimeout=0,
         WaitTimeSeconds=0
     )
 
-    logger.debug(response)
-
     if 'Messages' not in response:
         print("No messages in the SQS queue.")
         return None
@@ -45,87 +98,227 @@ def SQS_pull(max_num_msg):
     return response['Messages'][0]
 
 
+# messages of a schema version this LF2 does not know go back to the queue for
+# this long, for a newer consumer or the dead-letter queue of the redrive policy
+UNSUPPORTED_VISIBILITY_SECONDS = 300
+
+
+def decode_request(message):
+    """
+    slots of a request message, in one step for the versioned JSON body from LF1,
+    None when the schema version is unknown
+    """
+    body = message.get('Body', '')
+    if body.startswith('{'):
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            logger.error('malformed message body: {}'.format(e))
+            return {}
+        if data.get('v') == 1:
+            return data
+        logger.error('unsupported message schema version {}'.format(data.get('v')))
+        return None
+
+    # version 0, one String message attribute per slot
+    attributes = message.get('MessageAttributes', {})
+    return {name: value.get('StringValue') for name, value in attributes.items()}
+
+
 def delete_message_in_SQS(message):
     """
     delete the message in the SQS queue after processing
     """
-    sqs = boto3.client('sqs')
-    queue_url = "https://sqs.us-east-1.amazonaws.com/414199463068/RestaurantRequest"
-
+    sqs = aws_client('sqs')
     sqs.delete_message(
-        QueueUrl=queue_url,
+        QueueUrl=QUEUE_URL,
         ReceiptHandle=message['ReceiptHandle']
     )
     return
 
 
-def get_restaurants_recommendation(cuisine, email_msg):
+def release_message_in_SQS(message, visibility_timeout):
     """
-    get a random restaurant lists from OpenSearch and DynamoDB,
-    and format an email message to send
+    leave the message in the SQS queue, hidden for visibility_timeout seconds
     """
+    sqs = aws_client('sqs')
+    sqs.change_message_visibility(
+        QueueUrl=QUEUE_URL,
+        ReceiptHandle=message['ReceiptHandle'],
+        VisibilityTimeout=visibility_timeout
+    )
 
-    # OpenSearch search for the cuisine
-    auth = ('master', '6998Cloud!')
-    host = 'search-restaurants-6iggou56o64jxdkwcb7xb2iks4.us-east-1.es.amazonaws.com'
 
-    client = OpenSearch(
-        hosts=[{'host': host, 'port': 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection
-    )
+# restaurants considered around the user's own location, nearest first
+NEARBY_CANDIDATES = 30
 
-    query = {
-        'size': 1000,
-        'query': {
-            'multi_match': {
-                'query': cuisine
+# candidate lists and their alias tables per (cuisine, area), reused by the container
+CANDIDATE_TTL_SECONDS = 600
+_candidates = {}
+
+# field names per OpenSearch index, read again after CANDIDATE_TTL_SECONDS too
+_index_fields = {}
+
+# per email Bloom filter of the restaurants already recommended, reset after
+# HISTORY_TTL_SECONDS or HISTORY_CAPACITY ids; the table has TTL on expires_at
+HISTORY_TABLE = 'recommendation-history'
+HISTORY_TTL_SECONDS = 30 * 24 * 3600
+HISTORY_CAPACITY = 60
+
+
+def restaurants_query(cuisine, area=None, origin=None, size=1000):
+    """
+    OpenSearch query for a cuisine, filtered on the area and sorted by distance to origin
+    """
+    query = {'bool': {'must': [{'match': {'cuisine': cuisine}}]}}
+    if area is not None:
+        query['bool']['filter'] = [{'term': {'area': area}}]
+
+    body = {'size': size, 'query': query}
+    if origin is not None:
+        body['sort'] = [{
+            '_geo_distance': {
+                'location': {'lat': origin[0], 'lon': origin[1]},
+                'order': 'asc',
+                'unit': 'km'
             }
-        }
-    }
+        }]
+    return body
 
-    response = client.search(
-        body=query,
-        index='restaurants'
-    )
 
-    restaurant_list = response['hits']['hits']
+def indexed_fields(index='restaurants'):
+    """
+    fields mapped in the OpenSearch index, so an upgraded index is picked up within the TTL
+    """
+    entry = _index_fields.get(index)
+    if entry is None or entry[0] <= time.time():
+        mappings = opensearch_client().indices.get_mapping(index=index)
+        # keyed by the concrete index name, which differs when index is an alias
+        mapping = next(iter(mappings.values()))['mappings']
+        entry = (time.time() + CANDIDATE_TTL_SECONDS, frozenset(mapping.get('properties', {})))
+        _index_fields[index] = entry
+    return entry[1]
+
 
-    # generate 3 random restaurants and check info in DynamoDB
+def search_restaurants(cuisine, area=None, origin=None, size=1000):
+    """
+    OpenSearch hits for the cuisine in the area, nearest to origin first when given
+    """
+    # index built before restaurants had an area and a location: nothing to
+    # filter on, and OpenSearch rejects a distance sort on an unmapped field
+    fields = indexed_fields()
+    if area is not None and 'area' not in fields:
+        area = None
+    if origin is not None and 'location' not in fields:
+        origin = None
+
+    client = opensearch_client()
+    with METRICS.span('search'):
+        response = client.search(
+            body=restaurants_query(cuisine, area, origin, size),
+            index='restaurants'
+        )
+    return response['hits']['hits']
+
+
+def weighted(restaurant_list):
+    """
+    alias table over the hits, weighted by rating and number of reviews
+    """
+    return sampling.AliasTable([sampling.restaurant_weight(hit['_source'].get('rating'),
+                                                           hit['_source'].get('num_of_reviews'))
+                                for hit in restaurant_list])
+
+
+def candidates(cuisine, area):
+    """
+    (hits, alias table) for the cuisine in the area, searched once per CANDIDATE_TTL_SECONDS
+    """
+    key = (cuisine.lower(), area)
+    entry = _candidates.get(key)
+    if entry is None or entry[0] <= time.time():
+        restaurant_list = search_restaurants(cuisine, area)
+        entry = (time.time() + CANDIDATE_TTL_SECONDS, restaurant_list, weighted(restaurant_list))
+        _candidates[key] = entry
+    return entry[1], entry[2]
+
+
+def load_history(email):
+    """
+    (Bloom filter, count) of the restaurants recommended to the email, empty when expired
+    """
+    try:
+        with METRICS.span('history'):
+            item = dynamodb_table(HISTORY_TABLE).get_item(Key={'email': email}).get('Item')
+    except ClientError as e:
+        logger.error('cannot read recommendation history: {}'.format(e))
+        return sampling.BloomFilter(), 0, None
+
+    if item is None or int(item['expires_at']) <= time.time() or int(item['count']) >= HISTORY_CAPACITY:
+        return sampling.BloomFilter(), 0, None
+    # boto3 returns Binary attributes wrapped, the raw bytes are in .value
+    bits = getattr(item['bloom'], 'value', item['bloom'])
+    return sampling.BloomFilter(bits), int(item['count']), int(item['expires_at'])
+
+
+def save_history(email, history, count, expires_at):
+    try:
+        with METRICS.span('history'):
+            dynamodb_table(HISTORY_TABLE).put_item(Item={
+                'email': email,
+                'bloom': history.to_bytes(),
+                'count': count,
+                'expires_at': expires_at or int(time.time()) + HISTORY_TTL_SECONDS
+            })
+    except ClientError as e:
+        logger.error('cannot save recommendation history: {}'.format(e))
+
+
+def get_restaurants_recommendation(cuisine, email_msg, location=None, origin=None, history=None):
+    """
+    get a weighted random restaurant lists from OpenSearch and DynamoDB,
+    and format an email message to send, returns it with the picked ids
+
+    location is the catalog location the restaurants must be in, origin the
+    (lat, lon) of the user: when known, the suggestions are picked among the
+    nearest restaurants and listed nearest first. Restaurants in the history Bloom filter, the ones
+    already recommended to the user, are avoided.
+    """
+    area = location.lower() if location else None
     n_restaurants = 3
-    random.shuffle(restaurant_list)
-    indexes = random.sample(range(0, len(restaurant_list)), n_restaurants)
 
-    # connect to DynamoDB
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('yelp-restaurants')
+    # candidates for the cuisine in the area, with their alias table
+    if origin is not None:
+        # around the user's own location, not worth caching
+        restaurant_list = search_restaurants(cuisine, area, origin, NEARBY_CANDIDATES)
+        alias_table = weighted(restaurant_list)
+    else:
+        restaurant_list, alias_table = candidates(cuisine, area)
+
+    def seen(i):
+        return restaurant_list[i]['_source']['id'] in history
+
+    # pick 3 restaurants by rating and reviews, skipping the ones the user already got
+    indexes = alias_table.sample(n_restaurants, exclude=seen if history is not None else None)
+    picks = [restaurant_list[i] for i in indexes]
+    # nearest first when the hits are sorted by distance, the sort is stable otherwise
+    picks.sort(key=lambda hit: hit.get('sort', [0])[0])
+
+    # get their info in DynamoDB
+    table = dynamodb_table()
     recommendations = []
-    for i in range(n_restaurants):
-        ind = indexes[i]
-        id = restaurant_list[ind]['_source']['id']
-        info = table.get_item(Key={'business_id': id})['Item']
-
-        # Check "New York" in the restaurant address to make sure
-        # location = "manhattan"
-        if 'New York' not in info['address']:
-            while True:
-                new_ind = random.randrange(0, len(restaurant_list))
-                if new_ind not in indexes:
-                    indexes[i] = new_ind
-                    break
-            ind = indexes[i]
-            id = restaurant_list[ind]['_source']['id']
-            info = table.get_item(Key={'business_id': id})['Item']
-
-        recommendations.append('{num}. {name}, located at {location}'.format(num=i+1,
-                                                                             name=info['name'],
-                                                                             location=info['address']))
+    for i, hit in enumerate(picks):
+        with METRICS.span('detail_fetch'):
+            info = table.get_item(Key={'business_id': hit['_source']['id']})['Item']
+
+        recommendation = '{num}. {name}, located at {location}'.format(num=i+1,
+                                                                       name=info['name'],
+                                                                       location=info['address'])
+        recommendations.append(recommendation)
 
     email_msg += ', '.join(recommendations) + '. Enjoy your meal!'
 
-    return email_msg
+    return email_msg, [hit['_source']['id'] for hit in picks]
 
 
 def send_email(email_address, email_msg):
@@ -153,7 +346,7 @@ def send_email(email_address, email_msg):
     CHARSET = "UTF-8"
 
     # Create a new SES resource and specify a region.
-    client = boto3.client('ses', region_name=AWS_REGION)
+    client = aws_client('ses', region_name=AWS_REGION)
 
     # Try to send the email.
     try:
@@ -192,8 +385,22 @@ def lambda_handler(event, context):
     """
     main handler of events
     """
+    METRICS.begin()
+    try:
+        response = process_message()
+    finally:
+        METRICS.flush()
+        COLD_START.report()
+    return response
+
+
+def process_message():
+    """
+    pull one request from the queue and email the suggestions
+    """
     max_num_msg = 1
-    message = SQS_pull(max_num_msg)
+    with METRICS.span('sqs_pull'):
+        message = SQS_pull(max_num_msg)
     if message is None:
         return {
             'statusCode': 200,
@@ -201,15 +408,25 @@ def lambda_handler(event, context):
         }
 
     # get info from the message
-    location = message["MessageAttributes"]["Location"]["StringValue"]
-    cuisine = message["MessageAttributes"]["Cuisine"]["StringValue"]
-    num_of_people = message["MessageAttributes"]["NumberOfPeople"]["StringValue"]
-    date = message["MessageAttributes"]["Date"]["StringValue"]
-    time = message["MessageAttributes"]["Time"]["StringValue"]
-    email = message["MessageAttributes"]["Email"]["StringValue"]
+    request = decode_request(message)
+    if request is None:
+        with METRICS.span('sqs_release'):
+            release_message_in_SQS(message, UNSUPPORTED_VISIBILITY_SECONDS)
+        return {
+            'statusCode': 200,
+            'body': 'Unsupported message schema version, message left in the queue.'
+        }
+
+    location = request.get('Location')
+    cuisine = request.get('Cuisine')
+    num_of_people = request.get('NumberOfPeople')
+    date = request.get('Date')
+    time = request.get('Time')
+    email = request.get('Email')
 
     # delete the message in the SQS queue after processing
-    delete_message_in_SQS(message)
+    with METRICS.span('sqs_delete'):
+        delete_message_in_SQS(message)
 
     if cuisine is None or email is None:
         return {
@@ -224,18 +441,39 @@ def lambda_handler(event, context):
                                                 num_of_people=num_of_people,
                                                 date=date,
                                                 time=time)
-    email_msg = get_restaurants_recommendation(cuisine, email_msg)
+    # the user's coordinates are optional in the message
+    origin = None
+    if request.get('Latitude') is not None and request.get('Longitude') is not None:
+        origin = (float(request['Latitude']), float(request['Longitude']))
+
+    # restaurants already recommended to the email, updated once the email is sent
+    history, count, expires_at = load_history(email)
+
+    with METRICS.span('recommendation'):
+        email_msg, picked = get_restaurants_recommendation(cuisine, email_msg, location, origin, history)
+    if not picked:
+        return {
+            'statusCode': 200,
+            'body': 'No restaurants found for the request.'
+        }
 
     # send the email message to the user's email address
-    sent_status = send_email(email, email_msg)
+    with METRICS.span('email'):
+        sent_status = send_email(email, email_msg)
     if not sent_status:
         return {
             'statusCode': 200,
             'body': 'Error in sending email.'
         }
 
+    for business_id in picked:
+        history.add(business_id)
+    save_history(email, history, count + len(picked), expires_at)
+
     return {
         'statusCode': 200,
         'body': 'Finished LF2.'
     }
 
+
+COLD_START.imported()
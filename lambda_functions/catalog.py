@@ -0,0 +1,207 @@
+import json
+import os
+import re
+
+"""
+Shared cuisine and location catalog.
+
+The catalog lives in catalog.json next to this module and is loaded once per
+process (i.e. once per Lambda container). Both the bot (LF1) and the yelp
+scraper read it, so adding a cuisine or a city only means editing the JSON.
+"""
+
+CATALOG_PATH = os.environ.get('CATALOG_PATH',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json'))
+
+
+def load_catalog(path=CATALOG_PATH):
+    """
+    read the raw catalog from a JSON file
+    """
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+_catalog = load_catalog()
+
+# ordered names, used for display and for scraping
+CUISINE_NAMES = tuple(c.lower() for c in _catalog['cuisines'])
+LOCATION_NAMES = tuple(l.lower() for l in _catalog['locations'])
+
+# frozen sets for O(1) membership checks
+CUISINES = frozenset(CUISINE_NAMES)
+LOCATIONS = frozenset(LOCATION_NAMES)
+
+# location name -> yelp search location, e.g. 'manhattan' -> 'Manhattan, NY'
+LOCATION_QUERIES = {name.lower(): info.get('query', name.title())
+                    for name, info in _catalog['locations'].items()}
+
+
+""" --- Geo --- """
+
+# location name -> (bounding box, boundary polygon), the box rules out most points cheaply
+LOCATION_BOUNDARIES = {}
+for _name, _info in _catalog['locations'].items():
+    if 'boundary' in _info:
+        _lats = [p[0] for p in _info['boundary']]
+        _lons = [p[1] for p in _info['boundary']]
+        LOCATION_BOUNDARIES[_name.lower()] = ((min(_lats), min(_lons), max(_lats), max(_lons)),
+                                              tuple(tuple(p) for p in _info['boundary']))
+
+
+def in_polygon(lat, lon, polygon):
+    """
+    ray casting point-in-polygon test on (lat, lon) vertices
+    """
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat) and \
+                lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+def locate(lat, lon):
+    """
+    name of the catalog location containing the point, None when outside all of them
+    """
+    if lat is None or lon is None:
+        return None
+    for name, ((south, west, north, east), polygon) in LOCATION_BOUNDARIES.items():
+        if south <= lat <= north and west <= lon <= east and in_polygon(lat, lon, polygon):
+            return name
+    return None
+
+
+def aliases(section):
+    """
+    alias -> canonical name for one catalog section, canonical names map to themselves
+    """
+    table = {}
+    for name, info in _catalog[section].items():
+        table[name.lower()] = name.lower()
+        for alias in info.get('aliases', ()):
+            table[alias.lower()] = name.lower()
+    return table
+
+
+""" --- Free-text normalization --- """
+
+# words users add around a cuisine or a place, e.g. "thai food", "Japanese cuisine"
+NOISE_WORDS = frozenset(['food', 'foods', 'cuisine', 'restaurant', 'restaurants', 'style', 'dishes',
+                         'place', 'places', 'some', 'the', 'in', 'area'])
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+# matches scoring below this are not trusted and the slot is elicited again
+MIN_MATCH_SCORE = 0.5
+# places share words across cities ("Manhattan Beach", "York"), so a location
+# match needs a higher score and every word of the text has to match a word of
+# the location's names
+MIN_LOCATION_SCORE = 0.6
+MIN_WORD_SCORE = 0.5
+
+
+def clean_text(text):
+    """
+    lower-case, drop punctuation and noise words
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    kept = [w for w in words if w not in NOISE_WORDS]
+    return ' '.join(kept or words)
+
+
+def trigrams(text):
+    padded = '  ' + text + ' '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def dice(a, b):
+    """
+    Dice coefficient of two trigram sets
+    """
+    return 2.0 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+class TrigramIndex(object):
+    """
+    Inverted trigram index over canonical names and aliases.
+
+    Built once per container. A lookup only touches the terms that share at
+    least one trigram with the query and scores them with the Dice coefficient.
+    With every_word, the score is also capped by the worst matching word of the
+    query against the words of the names of the match, so an extra word like
+    "Beach" in "Manhattan Beach" sinks it.
+    """
+
+    def __init__(self, table, min_score=MIN_MATCH_SCORE, every_word=False):
+        self.min_score = min_score
+        self.every_word = every_word
+        self.exact = dict(table)
+        self.terms = list(table.items())
+        self.term_sizes = []
+        self.postings = {}
+        # canonical name -> trigrams of every word of its names
+        self.words = {}
+        for term_id, (term, name) in enumerate(self.terms):
+            grams = trigrams(term)
+            self.term_sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(term_id)
+            self.words.setdefault(name, set()).update(trigrams(word) for word in term.split())
+
+    def lookup(self, text):
+        """
+        return (canonical name, score) of the best match, or (None, 0.0)
+        """
+        if not text:
+            return None, 0.0
+
+        cleaned = clean_text(text)
+        if cleaned in self.exact:
+            return self.exact[cleaned], 1.0
+
+        grams = trigrams(cleaned)
+        shared = {}
+        for gram in grams:
+            for term_id in self.postings.get(gram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+        if not shared:
+            return None, 0.0
+
+        best_id, best_score = None, 0.0
+        for term_id, count in shared.items():
+            score = 2.0 * count / (len(grams) + self.term_sizes[term_id])
+            if score > best_score:
+                best_id, best_score = term_id, score
+        name = self.terms[best_id][1]
+
+        if self.every_word:
+            for word in cleaned.split():
+                word_grams = trigrams(word)
+                best_score = min(best_score, max(dice(word_grams, w) for w in self.words[name]))
+        return name, best_score
+
+
+CUISINE_INDEX = TrigramIndex(aliases('cuisines'))
+LOCATION_INDEX = TrigramIndex(aliases('locations'), min_score=MIN_LOCATION_SCORE, every_word=True)
+
+
+def normalize(index, text, min_score=None):
+    """
+    resolve free text to a canonical catalog name, None when the match is not confident
+    """
+    name, score = index.lookup(text)
+    if score < (index.min_score if min_score is None else min_score):
+        return None
+    return name
+
+
+def display_list(names):
+    """
+    format catalog names for messages to the user, e.g. 'Chinese, Japanese'
+    """
+    return ', '.join(name.title() for name in names)
@@ -0,0 +1,105 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+"""
+Cold-start bookkeeping shared by the Lambda handlers.
+
+Each handler creates a ColdStart at the top of its module and calls
+imported() at the bottom, so the module import time is known. One-time
+setup is timed with phase(), heavy dependencies are loaded on first use with
+lazy_import(). report() prints one JSON line for everything that has not
+been reported yet: the first invocation of a container reports import and
+init time, later invocations only report lazy imports they triggered.
+
+Run this file directly to measure a fresh import of every handler:
+
+    python coldstart.py
+"""
+
+HANDLERS = ('LF0', 'LF1', 'LF2')
+
+
+class ColdStart(object):
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.import_ms = None
+        self.phases = {}
+        self.reported = set()
+        self.invocations = 0
+
+    @contextmanager
+    def phase(self, name):
+        """
+        time a block of one-time setup
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    def lazy_import(self, module_name):
+        """
+        import a module on first use, and time it if it was not loaded yet
+        """
+        module = sys.modules.get(module_name)
+        if module is not None:
+            return module
+        with self.phase('import:' + module_name):
+            return importlib.import_module(module_name)
+
+    def imported(self):
+        """
+        mark the end of the handler module import
+        """
+        self.import_ms = round((time.perf_counter() - self.started) * 1000, 3)
+
+    def summary(self):
+        return {
+            'coldstart': self.handler,
+            'import_ms': self.import_ms,
+            'phases': dict(self.phases),
+        }
+
+    def report(self):
+        """
+        print phases not reported yet as one JSON line
+        """
+        self.invocations += 1
+        pending = {name: ms for name, ms in self.phases.items() if name not in self.reported}
+        if self.invocations > 1 and not pending:
+            return
+
+        record = {'coldstart': self.handler, 'phases': pending}
+        if self.invocations == 1:
+            record['import_ms'] = self.import_ms
+        print(json.dumps(record, sort_keys=True))
+        self.reported.update(pending)
+
+
+def measure(handler):
+    """
+    import a handler in a fresh interpreter and return its summary
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = 'import json, {0}; print(json.dumps({0}.COLD_START.summary()))'.format(handler)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=here)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    for name in HANDLERS:
+        try:
+            summary = measure(name)
+        except subprocess.CalledProcessError:
+            print('{}: import failed'.format(name))
+            continue
+        phases = ', '.join('{} {:.1f}ms'.format(k, v) for k, v in sorted(summary['phases'].items()))
+        print('{}: import {:.1f}ms{}'.format(name, summary['import_ms'], ' (' + phases + ')' if phases else ''))
@@ -0,0 +1,97 @@
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+
+"""
+Per-stage timing for the request path, written as CloudWatch embedded metric
+format (EMF) JSON so p50/p99 per stage can be read straight from the logs.
+
+Each invocation calls begin(), wraps its stages in span(), and calls flush(),
+which prints one compact JSON line with one metric per stage. Repeated stages
+in the same invocation (e.g. three detail fetches) are summed, and the number of
+calls is kept in <stage>_count.
+
+Environment variables:
+    METRICS_ENABLED      set to 0 to turn the metrics off completely
+    METRICS_SAMPLE_RATE  fraction of invocations to record, default 1.0
+    METRICS_NAMESPACE    CloudWatch namespace, default DiningConcierge
+"""
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DiningConcierge')
+
+
+class Metrics(object):
+
+    def __init__(self, handler, enabled=ENABLED, sample_rate=SAMPLE_RATE, namespace=NAMESPACE):
+        self.handler = handler
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.namespace = namespace
+        self.sampled = False
+        self.timings = {}
+        self.counts = {}
+
+    def begin(self):
+        """
+        start an invocation, the sampling decision holds for all of its spans
+        """
+        self.sampled = self.enabled and random.random() < self.sample_rate
+        self.timings = {}
+        self.counts = {}
+
+    @contextmanager
+    def span(self, stage):
+        """
+        time one stage of the current invocation
+        """
+        if not self.sampled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def record(self):
+        """
+        EMF record for the current invocation, None when nothing was timed
+        """
+        if not self.sampled or not self.timings:
+            return None
+
+        metrics = [{'Name': stage, 'Unit': 'Milliseconds'} for stage in self.timings]
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Handler']],
+                    'Metrics': metrics,
+                }],
+            },
+            'Handler': self.handler,
+        }
+        for stage, ms in self.timings.items():
+            record[stage] = round(ms, 3)
+            if self.counts[stage] > 1:
+                record[stage + '_count'] = self.counts[stage]
+        return record
+
+    def flush(self):
+        """
+        print the record of the current invocation as one JSON line
+        """
+        record = self.record()
+        if record is not None:
+            print(json.dumps(record, separators=(',', ':')))
+        self.sampled = False
+        self.timings = {}
+        self.counts = {}
@@ -0,0 +1,110 @@
+import hashlib
+import random
+
+"""
+Weighted sampling and recommendation history for LF2.
+
+AliasTable draws an index with probability proportional to its weight in O(1)
+after an O(n) build (Vose's alias method), so a candidate list is weighed once
+and reused for every request. BloomFilter is a compact set of the restaurant
+ids already recommended to a user, small enough to store per email.
+"""
+
+# prior for restaurants with few reviews: their rating is pulled towards
+# PRIOR_RATING as if they had PRIOR_REVIEWS more reviews at that rating
+PRIOR_RATING = 3.5
+PRIOR_REVIEWS = 50
+WEIGHT_EXPONENT = 3
+
+
+def restaurant_weight(rating, num_of_reviews):
+    """
+    sampling weight from the Bayesian average of the rating
+    """
+    rating = float(rating) if rating is not None else PRIOR_RATING
+    reviews = int(num_of_reviews or 0)
+    score = (rating * reviews + PRIOR_RATING * PRIOR_REVIEWS) / float(reviews + PRIOR_REVIEWS)
+    return score ** WEIGHT_EXPONENT
+
+
+class AliasTable(object):
+    """
+    O(1) weighted draws over range(len(weights))
+    """
+
+    def __init__(self, weights):
+        n = len(weights)
+        self.n = n
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            self.prob = [1.0] * n
+            self.alias = list(range(n))
+            return
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+    def __len__(self):
+        return self.n
+
+    def draw(self, rng=random):
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def sample(self, k, exclude=(), max_draws=50, rng=random):
+        """
+        up to k distinct indexes, skipping indexes for which exclude(i) is true;
+        once max_draws is spent, excluded indexes are accepted to fill the k
+        """
+        k = min(k, self.n)
+        picked = []
+        draws = 0
+        while len(picked) < k and draws < max_draws:
+            draws += 1
+            i = self.draw(rng)
+            if i not in picked and not (exclude and exclude(i)):
+                picked.append(i)
+        while len(picked) < k:
+            i = self.draw(rng)
+            if i not in picked:
+                picked.append(i)
+        return picked
+
+
+class BloomFilter(object):
+    """
+    fixed size Bloom filter over strings, serialized as raw bytes
+    """
+
+    def __init__(self, data=None, size_bytes=128, hashes=4):
+        self.bits = bytearray(data) if data else bytearray(size_bytes)
+        self.m = len(self.bits) * 8
+        self.k = hashes
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], 'little')
+        h2 = int.from_bytes(digest[4:], 'little') | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, key):
+        for p in self.positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(key))
+
+    def to_bytes(self):
+        return bytes(self.bits)
@@ -0,0 +1,19 @@
+import os
+import sys
+
+"""
+Shared setup of the tests: the repository and the handlers on sys.path, and
+the local stand-ins of benchmarks/backends.py installed once in place of AWS,
+OpenSearch and Yelp, before any handler or the scraper is imported.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'lambda_functions'), os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault('METRICS_ENABLED', '0')
+
+import backends
+
+BACKEND = backends.install(backends.LocalBackend())
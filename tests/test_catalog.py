@@ -0,0 +1,49 @@
+import unittest
+
+import support
+
+import catalog
+
+"""
+Free-text normalization of the cuisine and location slots.
+"""
+
+
+class NormalizeCuisineTest(unittest.TestCase):
+
+    def normalize(self, text):
+        return catalog.normalize(catalog.CUISINE_INDEX, text)
+
+    def test_typos_and_noise_words(self):
+        self.assertEqual(self.normalize('Itallian'), 'italian')
+        self.assertEqual(self.normalize('thai food'), 'thai')
+        self.assertEqual(self.normalize('Japanese cuisine'), 'japanese')
+        self.assertEqual(self.normalize('Vietnamise'), 'vietnamese')
+
+    def test_unsupported_cuisines(self):
+        self.assertIsNone(self.normalize('Indian'))
+        self.assertIsNone(self.normalize('Greek'))
+        self.assertIsNone(self.normalize(''))
+
+
+class NormalizeLocationTest(unittest.TestCase):
+
+    def normalize(self, text):
+        return catalog.normalize(catalog.LOCATION_INDEX, text)
+
+    def test_aliases_and_typos(self):
+        for text in ('NYC', 'New York', 'new york city', 'manhatan', 'Manhattan NY', 'Manhattan, New York'):
+            self.assertEqual(self.normalize(text), 'manhattan', text)
+
+    def test_other_places_sharing_a_word(self):
+        for text in ('Manhattan Beach', 'Manhattan, KS', 'York', 'Newark', 'Brooklyn'):
+            self.assertIsNone(self.normalize(text), text)
+
+    def test_extra_word_lowers_the_score(self):
+        _, score = catalog.LOCATION_INDEX.lookup('Manhattan')
+        _, extra = catalog.LOCATION_INDEX.lookup('Manhattan Beach')
+        self.assertLess(extra, score)
+
+
+if __name__ == '__main__':
+    unittest.main()
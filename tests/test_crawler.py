@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+# the scraper talks to Yelp and AWS through the local stand-ins
+import support
+
+import crawler
+import yelp_scraper
+
+"""
+Leases and retries of the crawl work queue, against the local Yelp stand-in.
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+
+OPTIONS = {
+    'rate': 0,
+    'lease_seconds': 60.0,
+    'max_attempts': 3,
+    'max_offset': 2 * yelp_scraper.SEARCH_LIMIT,
+}
+
+
+class CrawlQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, 'crawl.sqlite')
+        self.conn = crawler.connect(self.db_path)
+        self.conn.executescript(crawler.SCHEMA)
+        crawler.plan(self.conn, ['manhattan'], ['thai'], 1)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def shard(self):
+        return self.conn.execute('SELECT state, attempts, lease_owner FROM shards').fetchone()
+
+    def expire_leases(self):
+        self.conn.execute("UPDATE shards SET lease_expires = ? WHERE state = 'leased'", (time.time() - 1,))
+
+    def run_worker(self, options, timeout=5.0):
+        worker = threading.Thread(target=crawler.crawl_worker, args=(self.db_path, options))
+        worker.daemon = True
+        worker.start()
+        worker.join(timeout)
+        self.assertFalse(worker.is_alive(), 'crawl_worker did not return')
+
+    def test_lease_is_exclusive_until_it_expires(self):
+        self.assertIsNotNone(crawler.lease(self.conn, 'a', 60.0, 3))
+        self.assertIsNone(crawler.lease(self.conn, 'b', 60.0, 3))
+
+        self.expire_leases()
+        self.assertIsNotNone(crawler.lease(self.conn, 'b', 60.0, 3))
+        self.assertEqual(self.shard(), ('leased', 2, 'b'))
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        for owner in ('a', 'b', 'c'):
+            self.assertIsNotNone(crawler.lease(self.conn, owner, 60.0, 3))
+            self.expire_leases()
+
+        self.assertIsNone(crawler.lease(self.conn, 'd', 60.0, 3))
+        self.assertEqual(self.shard(), ('failed', 3, None))
+
+    def test_worker_returns_when_last_attempt_expires(self):
+        self.conn.execute("UPDATE shards SET state = 'leased', attempts = 3, lease_owner = 'dead', "
+                          "lease_expires = ?", (time.time() - 1,))
+        self.run_worker(OPTIONS)
+        self.assertEqual(self.shard()[:2], ('failed', 3))
+
+    def test_failed_pages_are_retried_until_attempts_run_out(self):
+        calls = []
+
+        def failing_search(*args):
+            calls.append(args)
+            raise IOError('connection reset')
+
+        search = yelp_scraper.search
+        yelp_scraper.search = failing_search
+        try:
+            self.run_worker(OPTIONS)
+        finally:
+            yelp_scraper.search = search
+
+        self.assertEqual(len(calls), OPTIONS['max_attempts'])
+        self.assertEqual(self.shard()[:2], ('failed', OPTIONS['max_attempts']))
+
+    def test_shard_resumes_from_recorded_offset(self):
+        self.conn.execute('UPDATE shards SET next_offset = ?', (yelp_scraper.SEARCH_LIMIT,))
+        self.run_worker(OPTIONS)
+
+        self.assertEqual(self.shard()[:2], ('done', 1))
+        requests = self.conn.execute('SELECT requests FROM shards').fetchone()[0]
+        self.assertEqual(requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
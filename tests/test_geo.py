@@ -0,0 +1,93 @@
+import json
+import unittest
+
+import support
+
+import LF2
+
+"""
+Area filtering and distance ranking of LF2 searches, against the local
+OpenSearch, DynamoDB, SQS and SES stand-ins.
+"""
+
+GEO_MAPPING = {
+    'id': {'type': 'keyword'},
+    'area': {'type': 'keyword'},
+    'location': {'type': 'geo_point'},
+}
+
+REQUEST = {
+    'v': 1,
+    'Location': 'manhattan',
+    'Cuisine': 'thai',
+    'NumberOfPeople': '2',
+    'Date': '2030-01-01',
+    'Time': '19:00',
+    'Email': 'user@example.com',
+}
+
+
+class GeoSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        support.BACKEND.reset()
+        LF2._candidates.clear()
+        LF2._index_fields.clear()
+        self.opensearch = support.BACKEND.opensearch
+        self.table = support.BACKEND.dynamodb.Table('yelp-restaurants')
+
+    def add(self, business_id, area=None, lat=None, lon=None):
+        doc = {'id': business_id, 'cuisine': ['thai'], 'rating': 4.0, 'num_of_reviews': 100}
+        if area is not None:
+            doc['area'] = area
+        if lat is not None:
+            doc['location'] = {'lat': lat, 'lon': lon}
+        self.opensearch.index(index='restaurants', id=business_id, body=json.dumps(doc))
+        self.table.put_item(Item={'business_id': business_id, 'name': business_id,
+                                  'address': '1 Broadway, New York, NY 10004'})
+
+    def request(self, **fields):
+        support.BACKEND.sqs.send_message(QueueUrl=LF2.QUEUE_URL, MessageBody=json.dumps(dict(REQUEST, **fields)))
+        return LF2.process_message()
+
+    def test_area_request_considers_every_restaurant_of_the_area(self):
+        self.opensearch.indices.create(index='restaurants', body={'mappings': {'properties': GEO_MAPPING}})
+        for i in range(50):
+            self.add('m{}'.format(i), 'manhattan', 40.71 + i * 0.001, -74.0)
+        self.add('b0', 'brooklyn', 40.68, -73.95)
+
+        restaurant_list, alias_table = LF2.candidates('thai', 'manhattan')
+        self.assertEqual(len(restaurant_list), 50)
+        self.assertEqual(len(alias_table), 50)
+
+    def test_user_origin_picks_nearest_first(self):
+        self.opensearch.indices.create(index='restaurants', body={'mappings': {'properties': GEO_MAPPING}})
+        for i in range(50):
+            self.add('m{}'.format(i), 'manhattan', 40.71 + i * 0.001, -74.0)
+
+        hits = LF2.search_restaurants('thai', 'manhattan', (40.71, -74.0), LF2.NEARBY_CANDIDATES)
+        self.assertEqual([hit['_id'] for hit in hits], ['m{}'.format(i) for i in range(LF2.NEARBY_CANDIDATES)])
+
+    def test_legacy_index_with_user_origin(self):
+        # documents indexed before area and location existed
+        for i in range(20):
+            self.add('t{}'.format(i))
+
+        response = self.request(Latitude=40.75, Longitude=-73.99)
+        self.assertEqual(response['body'], 'Finished LF2.')
+        body = support.BACKEND.ses.sent[-1]['Body']
+        self.assertEqual(body.count(', located at '), 3)
+
+    def test_no_restaurants_sends_no_email(self):
+        self.opensearch.indices.create(index='restaurants', body={'mappings': {'properties': GEO_MAPPING}})
+        self.add('b0', 'brooklyn', 40.68, -73.95)
+
+        response = self.request()
+        self.assertEqual(response['body'], 'No restaurants found for the request.')
+        self.assertEqual(support.BACKEND.ses.sent, [])
+        history = support.BACKEND.dynamodb.Table(LF2.HISTORY_TABLE)
+        self.assertEqual(history.items, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
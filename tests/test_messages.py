@@ -0,0 +1,120 @@
+import json
+import unittest
+
+import support
+
+import LF1
+import LF2
+
+"""
+The request message between LF1 and LF2, deployed separately: LF1 encodes it,
+LF2 decodes it, against the local SQS stand-in.
+"""
+
+REQUEST = {
+    'Location': 'manhattan',
+    'Cuisine': 'thai',
+    'NumberOfPeople': '2',
+    'Date': '2030-01-01',
+    'Time': '19:00',
+    'Email': 'user@example.com',
+}
+
+
+class MessageTest(unittest.TestCase):
+
+    def setUp(self):
+        support.BACKEND.reset()
+        self.sqs = support.BACKEND.sqs
+        self.queue = self.sqs.queue(LF1.QUEUE_URL)
+
+    def receive(self):
+        return self.sqs.receive_message(QueueUrl=LF2.QUEUE_URL, VisibilityTimeout=0)['Messages'][0]
+
+    def test_round_trip(self):
+        LF1.SQS_send(dict(REQUEST, Email=None))
+        request = LF2.decode_request(self.receive())
+
+        self.assertEqual(request['v'], LF1.MESSAGE_SCHEMA_VERSION)
+        self.assertIsNone(request['Email'])
+        # only the user's own coordinates, which LF1 does not collect
+        self.assertIsNone(request['Latitude'])
+        self.assertIsNone(request['Longitude'])
+        for slot in ('Location', 'Cuisine', 'NumberOfPeople', 'Date', 'Time'):
+            self.assertEqual(request[slot], REQUEST[slot], slot)
+
+    def test_version_0_attributes(self):
+        attributes = {name: {'DataType': 'String', 'StringValue': value} for name, value in REQUEST.items()}
+        self.sqs.send_message(QueueUrl=LF1.QUEUE_URL, MessageBody='Restaurant request',
+                              MessageAttributes=attributes)
+
+        self.assertEqual(LF2.decode_request(self.receive()), REQUEST)
+
+    def test_unknown_version_is_left_in_the_queue(self):
+        self.sqs.send_message(QueueUrl=LF1.QUEUE_URL, MessageBody=json.dumps(dict(REQUEST, v=2)))
+        self.assertIsNone(LF2.decode_request(self.receive()))
+
+        response = LF2.process_message()
+        self.assertIn('left in the queue', response['body'])
+        self.assertEqual(self.queue.deleted, 0)
+        self.assertEqual(self.queue.depth(), 1)
+        # hidden for a while, not received again right away
+        self.assertEqual(self.sqs.receive_message(QueueUrl=LF2.QUEUE_URL), {})
+
+    def test_malformed_body_is_deleted(self):
+        self.sqs.send_message(QueueUrl=LF1.QUEUE_URL, MessageBody='{"v": 1, "Cuisine"')
+        self.assertEqual(LF2.decode_request(self.receive()), {})
+
+        response = LF2.process_message()
+        self.assertIn('missing', response['body'])
+        self.assertEqual(self.queue.deleted, 1)
+        self.assertEqual(self.queue.depth(), 0)
+
+
+class BatchSenderTest(unittest.TestCase):
+
+    def setUp(self):
+        support.BACKEND.reset()
+        self.sqs = support.BACKEND.sqs
+        self.queue = self.sqs.queue(LF1.QUEUE_URL)
+
+    def test_batches_of_at_most_10(self):
+        sizes = []
+        send_message_batch = self.sqs.send_message_batch
+
+        def recording(QueueUrl, Entries, **kwargs):
+            sizes.append(len(Entries))
+            return send_message_batch(QueueUrl=QueueUrl, Entries=Entries, **kwargs)
+
+        self.sqs.send_message_batch = recording
+        try:
+            failed = LF1.SQS_send_batch([REQUEST] * 25)
+        finally:
+            del self.sqs.send_message_batch
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sizes, [10, 10, 5])
+        self.assertEqual(self.queue.sent, 25)
+
+    def test_entries_kept_when_the_batch_call_raises(self):
+        sender = LF1.SQSBatchSender(batch_size=5)
+
+        def failing(**kwargs):
+            raise IOError('connection reset')
+
+        self.sqs.send_message_batch = failing
+        try:
+            for _ in range(3):
+                sender.add(REQUEST)
+            self.assertRaises(IOError, sender.flush)
+        finally:
+            del self.sqs.send_message_batch
+
+        self.assertEqual([entry['Id'] for entry in sender.buffer], ['0', '1', '2'])
+        sender.flush()
+        self.assertEqual(sender.buffer, [])
+        self.assertEqual(self.queue.sent, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
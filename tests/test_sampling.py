@@ -0,0 +1,89 @@
+import random
+import unittest
+
+import support
+
+import sampling
+
+"""
+Weighted draws and recommendation history of LF2, with seeded generators.
+"""
+
+
+class AliasTableTest(unittest.TestCase):
+
+    def test_draw_frequencies_follow_weights(self):
+        weights = [1.0, 2.0, 3.0, 4.0]
+        table = sampling.AliasTable(weights)
+        rng = random.Random(0)
+        n = 40000
+        counts = [0] * len(weights)
+        for _ in range(n):
+            counts[table.draw(rng)] += 1
+
+        for count, weight in zip(counts, weights):
+            self.assertAlmostEqual(count / float(n), weight / sum(weights), delta=0.01)
+
+    def test_zero_weight_is_never_drawn(self):
+        table = sampling.AliasTable([0.0, 1.0, 1.0])
+        rng = random.Random(1)
+        self.assertNotIn(0, [table.draw(rng) for _ in range(1000)])
+
+    def test_sample_is_distinct(self):
+        table = sampling.AliasTable([1.0] * 10)
+        picked = table.sample(5, rng=random.Random(2))
+        self.assertEqual(len(picked), 5)
+        self.assertEqual(len(set(picked)), 5)
+
+    def test_sample_skips_excluded(self):
+        table = sampling.AliasTable([1.0] * 10)
+        picked = table.sample(3, exclude=lambda i: i % 2 == 0, rng=random.Random(3))
+        self.assertEqual(len(picked), 3)
+        self.assertTrue(all(i % 2 == 1 for i in picked))
+
+    def test_sample_falls_back_after_max_draws(self):
+        table = sampling.AliasTable([1.0] * 10)
+        calls = []
+
+        def excluded(i):
+            calls.append(i)
+            return True
+
+        picked = table.sample(3, exclude=excluded, max_draws=20, rng=random.Random(4))
+        self.assertEqual(len(set(picked)), 3)
+        self.assertLessEqual(len(calls), 20)
+
+    def test_sample_more_than_available(self):
+        table = sampling.AliasTable([1.0, 2.0])
+        self.assertEqual(sorted(table.sample(3, rng=random.Random(5))), [0, 1])
+        self.assertEqual(sampling.AliasTable([]).sample(3), [])
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_added_ids_survive_serialization(self):
+        history = sampling.BloomFilter()
+        ids = ['business-{}'.format(i) for i in range(40)]
+        for business_id in ids:
+            history.add(business_id)
+
+        reloaded = sampling.BloomFilter(history.to_bytes())
+        self.assertEqual(len(history.to_bytes()), 128)
+        for business_id in ids:
+            self.assertIn(business_id, history)
+            self.assertIn(business_id, reloaded)
+
+    def test_few_false_positives(self):
+        history = sampling.BloomFilter()
+        for i in range(40):
+            history.add('business-{}'.format(i))
+
+        false_positives = sum('other-{}'.format(i) in history for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_empty_filter_contains_nothing(self):
+        self.assertNotIn('business-0', sampling.BloomFilter())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,8 @@ from decimal import Decimal
 import time
 from opensearchpy import OpenSearch, RequestsHttpConnection
 
+from lambda_functions import catalog
+
 
 # This client code can run on Python 2.x or 3.x.  Your imports can be
 # simpler if you only need one of those.
@@ -53,6 +55,9 @@ BUSINESS_PATH = '/v3/businesses/'  # Business ID will come after slash.
 # DEFAULT_LOCATION = 'San Francisco, CA'
 SEARCH_LIMIT = 50
 
+# print every request URL
+VERBOSE = True
+
 
 def request(host, path, api_key, url_params=None):
     """Given your API_KEY, send a GET request to the API.
@@ -75,19 +80,22 @@ def request(host, path, api_key, url_params=None):
         'Authorization': 'Bearer %s' % api_key,
     }
 
-    print(u'Querying {0} ...'.format(url))
+    if VERBOSE:
+        print(u'Querying {0} ...'.format(url))
 
     response = requests.request('GET', url, headers=headers, params=url_params)
 
     return response.json()
 
 
-def search(api_key, term, location, offset):
+def search(api_key, term, location, offset, latitude=None, longitude=None, radius=None):
     """Query the Search API by a search term and location.
 
     Args:
         term (str): The search term passed to the API.
         location (str): The search location passed to the API.
+        latitude, longitude (float): Search around this point instead of location.
+        radius (int): Search radius in meters around the point, at most 40000.
 
     Returns:
         dict: The JSON response from the request.
@@ -95,10 +103,16 @@ def search(api_key, term, location, offset):
 
     url_params = {
         'term': term.replace(' ', '+'),
-        'location': location.replace(' ', '+'),
         'limit': SEARCH_LIMIT,
         'offset': offset
     }
+    if latitude is not None and longitude is not None:
+        url_params['latitude'] = latitude
+        url_params['longitude'] = longitude
+        if radius is not None:
+            url_params['radius'] = int(min(radius, 40000))
+    else:
+        url_params['location'] = location.replace(' ', '+')
     return request(API_HOST, SEARCH_PATH, api_key, url_params=url_params)
 
 
@@ -133,8 +147,8 @@ def yelp_scrape(file_path):
     """
     Scrape restaurants from yelp and output to a JSON file
     """
-    cuisine_types = ['chinese', 'japanese', 'thai', 'italian', 'american', 'mexican', 'vietnamese', 'korean']
-    location = "Manhattan, NY"
+    cuisine_types = catalog.CUISINE_NAMES
+    locations = [catalog.LOCATION_QUERIES[name] for name in catalog.LOCATION_NAMES]
     restaurants = dict()
 
     start_time = time.time()
@@ -142,25 +156,26 @@ def yelp_scrape(file_path):
 
     # scrape data from yelp
     try:
-        for cuisine in cuisine_types:
-            term = cuisine + ' restaurants'
-            print(term)
-            count = 0
-            for offset in range(0, 1401, 50):
-                businesses = query_api(term, location, offset)
-                # if no businesses found, search for the next cuisine
-                if not businesses:
-                    break
-                count += len(businesses)
-                # add non-duplicate businesses to restaurants
-                for business in businesses:
-                    business_id = business['id']
-                    if business_id not in restaurants:
-                        business['cuisine'] = [cuisine]
-                        restaurants[business_id] = business
-                    else:
-                        restaurants[business_id]['cuisine'].append(cuisine)
-            print('Total {} businesses found\n'.format(count))
+        for location in locations:
+            for cuisine in cuisine_types:
+                term = cuisine + ' restaurants'
+                print(term, 'in', location)
+                count = 0
+                for offset in range(0, 1401, 50):
+                    businesses = query_api(term, location, offset)
+                    # if no businesses found, search for the next cuisine
+                    if not businesses:
+                        break
+                    count += len(businesses)
+                    # add non-duplicate businesses to restaurants
+                    for business in businesses:
+                        business_id = business['id']
+                        if business_id not in restaurants:
+                            business['cuisine'] = [cuisine]
+                            restaurants[business_id] = business
+                        elif cuisine not in restaurants[business_id]['cuisine']:
+                            restaurants[business_id]['cuisine'].append(cuisine)
+                print('Total {} businesses found\n'.format(count))
         print('Total {} restaurants found\n'.format(len(restaurants.keys())))
     except HTTPError as error:
         sys.exit(
@@ -181,6 +196,17 @@ def yelp_scrape(file_path):
         json_file.write(json_str)
 
 
+def coordinates(restaurant):
+    """
+    (latitude, longitude) of a scraped restaurant, (None, None) when Yelp has none
+    """
+    coords = restaurant.get('coordinates') or {}
+    lat, lon = coords.get('latitude'), coords.get('longitude')
+    if lat is None or lon is None:
+        return None, None
+    return float(lat), float(lon)
+
+
 def DynamoDB_store(file_path):
     """
     Store the scraped restaurants in DynamoDB
@@ -195,20 +221,24 @@ def DynamoDB_store(file_path):
         print("---------- Start uploading restaurants data to DynamoDB ----------\n")
 
         for i, r in restaurants.items():
-            response = table.put_item(
-                Item={
-                    'business_id': r['id'],
-                    'name': r['name'],
-                    'address': ', '.join(r['location']['display_address']),
-                    'coordinates': {'latitude': str(r['coordinates']['latitude']),
-                                    'longitude': str(r['coordinates']['longitude'])},
-                    'num_of_reviews': r['review_count'],
-                    'rating': Decimal(r['rating']),
-                    'zip_code': r['location']['zip_code'],
-                    'cuisine': r['cuisine'],
-                    'inserted_at_timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-            )
+            item = {
+                'business_id': r['id'],
+                'name': r['name'],
+                'address': ', '.join(r['location']['display_address']),
+                'num_of_reviews': r['review_count'],
+                'rating': Decimal(r['rating']),
+                'zip_code': r['location']['zip_code'],
+                'cuisine': r['cuisine'],
+                'inserted_at_timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            lat, lon = coordinates(r)
+            if lat is not None:
+                # numbers, DynamoDB takes them as Decimal
+                item['coordinates'] = {'latitude': Decimal(str(lat)),
+                                       'longitude': Decimal(str(lon))}
+                item['area'] = catalog.locate(lat, lon)
+
+            response = table.put_item(Item=item)
 
         time_elapsed = time.time() - start_time
         print("\nUploading data to DynamoDB runs {:.0f}m {:.0f}s".format(time_elapsed // 60, time_elapsed % 60))
@@ -231,6 +261,18 @@ def OpenSearch_store(file_path):
         connection_class=RequestsHttpConnection
     )
 
+    # area is filtered on and location is a geo_point, so LF2 can filter and sort by distance
+    geo_fields = {
+        'area': {'type': 'keyword'},
+        'location': {'type': 'geo_point'}
+    }
+    if not client.indices.exists(index='restaurants'):
+        properties = dict(geo_fields, id={'type': 'keyword'})
+        client.indices.create(index='restaurants', body={'mappings': {'properties': properties}})
+    else:
+        # only add fields: an index from before has id as dynamic text, whose type cannot change
+        client.indices.put_mapping(index='restaurants', body={'properties': geo_fields})
+
     with open(file_path) as json_file:
         restaurants = json.load(json_file)
 
@@ -240,8 +282,15 @@ def OpenSearch_store(file_path):
         for i, r in restaurants.items():
             restaurant = {
                 'id': r['id'],
-                'cuisine': r['cuisine']
+                'cuisine': r['cuisine'],
+                # LF2 weighs its suggestions by these without reading DynamoDB
+                'rating': r['rating'],
+                'num_of_reviews': r['review_count']
             }
+            lat, lon = coordinates(r)
+            if lat is not None:
+                restaurant['location'] = {'lat': lat, 'lon': lon}
+                restaurant['area'] = catalog.locate(lat, lon)
 
             response = client.index(
                 index='restaurants',